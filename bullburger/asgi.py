@@ -5,6 +5,12 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Los streams en vivo (stock en ``/api/stock/stream/`` y tablero de cocina en
+``/empleado/api/pedidos/stream/``) son vistas asíncronas que mantienen la
+conexión abierta: servir el proyecto con este módulo, p. ej.
+``uvicorn bullburger.asgi:application`` o gunicorn con ``-k uvicorn.workers.UvicornWorker``.
+Bajo WSGI cada menú o tablet abierta ocuparía un hilo completo.
 """
 
 import os
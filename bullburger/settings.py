@@ -59,6 +59,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Cada versión de stock/catálogo se lee una vez por petición
+    'productos.versiones.versiones_por_peticion',
 ]
 
 ROOT_URLCONF = 'bullburger.urls'
@@ -159,6 +161,46 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# ============================
+#  CACHÉ
+# ============================
+# Compartida entre todos los workers de gunicorn (el mapa de stock y las
+# versiones de stock/catálogo se leen de aquí). En varios servidores, o para
+# que leer una versión no toque el disco, definir REDIS_URL.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        }
+    }
+
+# Minutos que el stock de la bolsa queda reservado (ver productos/stock.py).
+# Las reservas vencidas se liberan con: python manage.py liberar_reservas
+RESERVA_CARRITO_MINUTOS = 15
+
+# Horas que se guarda la respuesta de un Idempotency-Key (productos/idempotencia.py).
+# Las vencidas se borran con: python manage.py purgar_idempotencia
+IDEMPOTENCIA_HORAS = 24
+
+# Stock diferido para hora pico: el checkout sólo inserta consumos y un
+# proceso los aplica a los ingredientes (ver productos/stock.py). Requiere
+# dejar corriendo: python manage.py compactar_stock --cada 2
+# Al desactivarlo, vaciar antes el libro con: python manage.py compactar_stock
+INVENTARIO_STOCK_DIFERIDO = False
+
+# Facturas bajo demanda: el PDF se genera la primera vez que el cliente lo
+# descarga. Con False el checkout lo encola y lo genera el worker:
+# python manage.py generar_facturas --cada 5
+FACTURAS_BAJO_DEMANDA = True
+
 # ============================
 #  SESIONES (SEGURIDAD)
 # ============================
@@ -0,0 +1,82 @@
+import time
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from inventario.utils_factura import Image, RenderizadorFactura, TAMANO_LOGO, renderizador
+from pedidos.models import Pedido
+
+
+class RenderizadorSinCache(RenderizadorFactura):
+    """Cómo se dibujaba antes: logo original buscado en disco y una consulta por línea."""
+
+    def logo(self):
+        path = self._buscar_logo()
+        if not path:
+            return super().logo()
+        return Image(path, width=TAMANO_LOGO, height=TAMANO_LOGO)
+
+    def detalles(self, pedido):
+        return pedido.detallepedido_set.all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide el tiempo, las consultas y el tamaño del PDF por factura con el '
+        'renderizador compartido frente a armarlo todo en cada factura. '
+        'Escribe en memoria, no toca media/.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pedido', type=int, help='Pedido a facturar (por defecto el último con detalles)')
+        parser.add_argument('-n', '--repeticiones', type=int, default=50)
+
+    def handle(self, *args, **options):
+        if options['pedido']:
+            pedido_id = options['pedido']
+        else:
+            pedido_id = (
+                Pedido.objects.filter(detallepedido__isnull=False)
+                .order_by('-id').values_list('id', flat=True).first()
+            )
+        if not pedido_id or not Pedido.objects.filter(id=pedido_id).exists():
+            raise CommandError('No hay un pedido con detalles para medir.')
+
+        n = options['repeticiones']
+        self.stdout.write(f'Pedido {pedido_id}, {n} facturas por variante')
+
+        antes = self._medir(
+            n,
+            lambda: RenderizadorSinCache(),
+            lambda: Pedido.objects.get(id=pedido_id),
+        )
+        despues = self._medir(
+            n,
+            lambda: renderizador,
+            lambda: Pedido.objects.select_related('usuario').get(id=pedido_id),
+        )
+
+        for nombre, (ms, consultas, tamano) in (('antes', antes), ('después', despues)):
+            self.stdout.write(
+                f'  {nombre:8} {ms:8.2f} ms/factura  {consultas:5.1f} consultas  {tamano / 1024:8.1f} KB'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'x{antes[0] / despues[0]:.1f} más rápido, PDF {antes[2] / max(despues[2], 1):.1f} veces más chico'
+        ))
+
+    def _medir(self, n, obtener_renderizador, obtener_pedido):
+        # Una vuelta de calentamiento: la caché del logo cuenta como arranque del proceso
+        obtener_renderizador().renderizar(obtener_pedido(), BytesIO())
+
+        tamano = 0
+        inicio = time.perf_counter()
+        with CaptureQueriesContext(connection) as consultas:
+            for _ in range(n):
+                salida = BytesIO()
+                obtener_renderizador().renderizar(obtener_pedido(), salida)
+                tamano = len(salida.getvalue())
+        transcurrido = time.perf_counter() - inicio
+
+        return transcurrido * 1000 / n, len(consultas) / n, tamano
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+def corregir_stock_negativo(apps, schema_editor):
+    # El checkout viejo podía dejar saldos negativos; sin esto la
+    # restricción no se puede crear
+    Ingrediente = apps.get_model('inventario', 'Ingrediente')
+    Ingrediente.objects.filter(stock_actual__lt=0).update(stock_actual=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0003_remove_ingrediente_costo_unitario_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(corregir_stock_negativo, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingrediente',
+            constraint=models.CheckConstraint(condition=models.Q(('stock_actual__gte', 0)), name='ingrediente_stock_no_negativo'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0004_ingrediente_stock_no_negativo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsumoPendiente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('ingrediente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventario.ingrediente')),
+            ],
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def compilar_desde_recetas(apps, schema_editor):
+    # Todavía no hay combos: la lista compilada es la receta misma
+    Receta = apps.get_model('inventario', 'Receta')
+    MaterialProducto = apps.get_model('inventario', 'MaterialProducto')
+    MaterialProducto.objects.bulk_create(
+        MaterialProducto(producto_id=producto_id, ingrediente_id=ingrediente_id, cantidad=cantidad)
+        for producto_id, ingrediente_id, cantidad in Receta.objects.values_list(
+            'producto_id', 'ingrediente_id', 'cantidad'
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0005_consumopendiente'),
+        ('productos', '0008_claveidempotencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComponenteCombo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField(default=1)),
+                ('combo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='componentes', to='productos.producto')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='en_combos', to='productos.producto')),
+            ],
+            options={
+                'unique_together': {('combo', 'producto')},
+            },
+        ),
+        migrations.CreateModel(
+            name='MaterialProducto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('ingrediente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='materiales', to='inventario.ingrediente')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='materiales', to='productos.producto')),
+            ],
+            options={
+                'unique_together': {('producto', 'ingrediente')},
+            },
+        ),
+        migrations.RunPython(compilar_desde_recetas, migrations.RunPython.noop),
+    ]
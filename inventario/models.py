@@ -1,4 +1,5 @@
 # inventario/models.py
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.contrib.auth import get_user_model
 from productos.models import Producto
@@ -62,6 +63,12 @@ class Ingrediente(models.Model):
     creado_en = models.DateTimeField(auto_now_add=True)
     actualizado_en = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            # Red de seguridad: ningún descuento puede dejar stock negativo
+            models.CheckConstraint(condition=models.Q(stock_actual__gte=0), name='ingrediente_stock_no_negativo'),
+        ]
+
     def __str__(self):
         return f"{self.nombre} ({self.stock_actual} {self.unidad_medida})"
 
@@ -115,7 +122,54 @@ class Receta(models.Model):
     def hay_suficiente_stock(self):
         """Verifica si hay suficiente stock para preparar este ingrediente"""
         return self.ingrediente.stock_actual >= self.cantidad
-    
+
+
+class ComponenteCombo(models.Model):
+    """Un combo se arma con otros productos (ej. hamburguesa + papas + bebida)."""
+    combo = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='componentes')
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='en_combos')
+    cantidad = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        unique_together = ['combo', 'producto']
+
+    def __str__(self):
+        return f"{self.combo.nombre} - {self.cantidad}x {self.producto.nombre}"
+
+    def clean(self):
+        # Un combo no puede contenerse a sí mismo, ni a través de otro combo
+        pendientes = [self.producto_id]
+        vistos = set()
+        while pendientes:
+            actual = pendientes.pop()
+            if actual == self.combo_id:
+                raise ValidationError('Un combo no puede incluirse a sí mismo.')
+            if actual in vistos:
+                continue
+            vistos.add(actual)
+            pendientes.extend(
+                ComponenteCombo.objects.filter(combo_id=actual).values_list('producto_id', flat=True)
+            )
+
+
+class MaterialProducto(models.Model):
+    """
+    Lista de materiales COMPILADA: cuánto de cada ingrediente consume una
+    unidad del producto, con los combos ya resueltos a ingredientes. No se
+    edita a mano; se regenera desde Receta y ComponenteCombo
+    (ver productos.stock.compilar_materiales).
+    """
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='materiales')
+    ingrediente = models.ForeignKey(Ingrediente, on_delete=models.CASCADE, related_name='materiales')
+    cantidad = models.DecimalField(max_digits=12, decimal_places=2)
+
+    class Meta:
+        unique_together = ['producto', 'ingrediente']
+
+    def __str__(self):
+        return f"{self.producto.nombre} - {self.cantidad} {self.ingrediente.nombre}"
+
+
 class MovimientoInventario(models.Model):
     TIPOS_MOVIMIENTO = [
         ('entrada', 'Entrada'),
@@ -140,6 +194,20 @@ class MovimientoInventario(models.Model):
         else:
             return f"{self.tipo} - {self.producto.nombre} - {self.fecha}"
         
+class ConsumoPendiente(models.Model):
+    """
+    Libro de consumos sin aplicar (modo INVENTARIO_STOCK_DIFERIDO): el
+    checkout sólo inserta aquí y ``compactar_stock`` los descuenta de
+    ``Ingrediente.stock_actual`` por lotes. Stock real = stock_actual - SUM(cantidad).
+    """
+    ingrediente = models.ForeignKey(Ingrediente, on_delete=models.CASCADE)
+    cantidad = models.DecimalField(max_digits=10, decimal_places=2)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"-{self.cantidad} {self.ingrediente.nombre} (pendiente)"
+
+
 class AjusteInventario(models.Model):
     # ✅ CAMBIADO A CASCADE para eliminación completa
     ingrediente = models.ForeignKey(Ingrediente, on_delete=models.CASCADE)
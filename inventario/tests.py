@@ -1,3 +1,90 @@
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
+
 from django.test import TestCase
 
-# Create your tests here.
+from pedidos.models import DetallePedido, Pedido
+from productos.models import Categoria, Producto
+from productos.stock import compilar_materiales
+from usuarios.models import Rol, Usuario
+from .models import ComponenteCombo, Ingrediente, MaterialProducto, Receta
+from .utils_factura import RenderizadorFactura
+
+
+class ListaMaterialesTests(TestCase):
+    """Los combos se aplanan a ingredientes en MaterialProducto."""
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre='Combos')
+        self.pan = Ingrediente.objects.create(nombre='Pan', unidad_medida='unidad', stock_actual=100)
+        self.carne = Ingrediente.objects.create(nombre='Carne', unidad_medida='g', stock_actual=10000)
+        self.papa = Ingrediente.objects.create(nombre='Papa', unidad_medida='g', stock_actual=10000)
+
+        self.hamburguesa = Producto.objects.create(nombre='Hamburguesa', precio=5, categoria=categoria)
+        self.papas = Producto.objects.create(nombre='Papas', precio=2, categoria=categoria)
+        self.combo = Producto.objects.create(nombre='Combo', precio=8, categoria=categoria)
+        self.familiar = Producto.objects.create(nombre='Familiar', precio=20, categoria=categoria)
+
+        Receta.objects.create(producto=self.hamburguesa, ingrediente=self.pan, cantidad=Decimal('1'))
+        Receta.objects.create(producto=self.hamburguesa, ingrediente=self.carne, cantidad=Decimal('150'))
+        Receta.objects.create(producto=self.papas, ingrediente=self.papa, cantidad=Decimal('200'))
+        ComponenteCombo.objects.create(combo=self.combo, producto=self.hamburguesa, cantidad=2)
+        ComponenteCombo.objects.create(combo=self.combo, producto=self.papas, cantidad=1)
+        # Combo de combos
+        ComponenteCombo.objects.create(combo=self.familiar, producto=self.combo, cantidad=2)
+        ComponenteCombo.objects.create(combo=self.familiar, producto=self.papas, cantidad=1)
+
+    def materiales(self, producto):
+        return dict(
+            MaterialProducto.objects.filter(producto=producto).values_list('ingrediente_id', 'cantidad')
+        )
+
+    def test_aplana_combos_anidados(self):
+        self.assertEqual(self.materiales(self.combo), {
+            self.pan.id: 2, self.carne.id: 300, self.papa.id: 200,
+        })
+        self.assertEqual(self.materiales(self.familiar), {
+            self.pan.id: 4, self.carne.id: 600, self.papa.id: 600,
+        })
+
+    def test_cambio_de_receta_llega_a_los_combos(self):
+        receta = Receta.objects.get(producto=self.hamburguesa, ingrediente=self.carne)
+        receta.cantidad = Decimal('200')
+        receta.save()
+
+        self.assertEqual(self.materiales(self.combo)[self.carne.id], 400)
+        self.assertEqual(self.materiales(self.familiar)[self.carne.id], 800)
+
+    def test_recompilar_todo_da_lo_mismo(self):
+        antes = {p.id: self.materiales(p) for p in (self.combo, self.familiar)}
+        compilar_materiales()
+        self.assertEqual({p.id: self.materiales(p) for p in (self.combo, self.familiar)}, antes)
+
+
+class RenderizadorFacturaTests(TestCase):
+
+    def setUp(self):
+        rol = Rol.objects.get_or_create(nombre='Cliente')[0]
+        usuario = Usuario.objects.create_user('cliente@bullburger.test', 'x', nombre='Cliente', rol=rol)
+        categoria = Categoria.objects.create(nombre='Hamburguesas')
+        self.pedido = Pedido.objects.create(usuario=usuario, total=Decimal('16'))
+        for nombre, cantidad in (('Clásica', 2), ('Doble', 1)):
+            producto = Producto.objects.create(nombre=nombre, precio=Decimal('5'), categoria=categoria)
+            DetallePedido.objects.create(
+                pedido=self.pedido, producto=producto, cantidad=cantidad, subtotal=Decimal('5') * cantidad,
+            )
+        self.pedido = Pedido.objects.select_related('usuario').get(id=self.pedido.id)
+
+    def test_detalles_en_una_consulta(self):
+        salida = BytesIO()
+        with self.assertNumQueries(1):
+            RenderizadorFactura().renderizar(self.pedido, salida)
+        self.assertTrue(salida.getvalue().startswith(b'%PDF'))
+
+    def test_logo_se_busca_una_sola_vez(self):
+        renderizador = RenderizadorFactura()
+        with mock.patch.object(RenderizadorFactura, '_buscar_logo', return_value=None) as buscar:
+            for _ in range(3):
+                renderizador.renderizar(self.pedido, BytesIO())
+        self.assertEqual(buscar.call_count, 1)
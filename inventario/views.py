@@ -3,9 +3,10 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
-from django.db import models
+from django.db import models, transaction
 from .models import Ingrediente, Receta, MovimientoInventario, Producto
 from .forms import IngredienteForm, AjusteInventarioForm
+from productos.stock import compactar_consumos
 
 @login_required
 def lista_inventario(request):
@@ -25,6 +26,7 @@ def lista_inventario(request):
     return render(request, 'inventario/inventario.html', context)
 
 @login_required
+@transaction.atomic
 def crear_ingrediente(request):
     if request.method == 'POST':
         form = IngredienteForm(request.POST)
@@ -51,8 +53,21 @@ def crear_ingrediente(request):
     
     return redirect('inventario')
 
+def _compactar(request, ingrediente_id):
+    # Con stock diferido, primero se aplican los consumos pendientes: el
+    # formulario muestra y reemplaza el stock real. Si se vendió de más, los
+    # consumos siguen pendientes y se avisa cuánto falta
+    for nombre, stock, pendiente in compactar_consumos([ingrediente_id])[1]:
+        messages.warning(
+            request,
+            f'"{nombre}" está sobrevendido: hay {stock} y se consumieron {pendiente} '
+            f'(faltan {pendiente - stock}). Se descontará al reponer.'
+        )
+
 @login_required
+@transaction.atomic
 def editar_ingrediente(request, ingrediente_id):
+    _compactar(request, ingrediente_id)
     ingrediente = get_object_or_404(Ingrediente, id=ingrediente_id, activo=True)
     
     if request.method == 'POST':
@@ -139,7 +154,9 @@ def eliminar_ingrediente(request, ingrediente_id):
     return redirect('inventario')
 
 @login_required
+@transaction.atomic
 def ajustar_inventario(request, ingrediente_id):
+    _compactar(request, ingrediente_id)
     ingrediente = get_object_or_404(Ingrediente, id=ingrediente_id, activo=True)
     
     if request.method == 'POST':
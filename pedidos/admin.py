@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Pedido, DetallePedido
+from .models import Pedido, DetallePedido, TrabajoFactura
 
 class DetallePedidoInline(admin.TabularInline):
     model = DetallePedido
@@ -9,4 +9,11 @@ class DetallePedidoInline(admin.TabularInline):
 class PedidoAdmin(admin.ModelAdmin):
     list_display = ['id', 'usuario', 'estado', 'total', 'fecha']
     list_filter = ['estado', 'fecha']
-    inlines = [DetallePedidoInline]
\ No newline at end of file
+    inlines = [DetallePedidoInline]
+
+
+@admin.register(TrabajoFactura)
+class TrabajoFacturaAdmin(admin.ModelAdmin):
+    list_display = ['pedido', 'estado', 'intentos', 'disponible_en', 'actualizado_en']
+    list_filter = ['estado']
+    readonly_fields = ['ultimo_error']
@@ -0,0 +1,215 @@
+# pedidos/almacen.py
+"""
+Organización de las facturas en el storage.
+
+Cada PDF vive en ``facturas/AAAA/MM/DD/factura_pedido_<id>.pdf`` según la
+fecha del pedido (``nombre_factura`` en inventario/utils_factura.py), así ninguna carpeta junta cientos de
+miles de archivos. Los meses viejos se empaquetan en
+``facturas/archivo/AAAA-MM.zip`` (``archivar_mes``) y ``Pedido.factura_pdf``
+no cambia: ``Archivos.abrir`` lee del ZIP y ``extraer`` devuelve el PDF a su
+lugar cuando alguien lo descarga.
+"""
+import os
+import posixpath
+import re
+import shutil
+import tempfile
+import zipfile
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+from inventario.utils_factura import CARPETA_FACTURAS
+
+CARPETA_ARCHIVO = posixpath.join(CARPETA_FACTURAS, 'archivo')
+BLOQUE = 64 * 1024
+
+_FRAGMENTADA = re.compile(rf'^{CARPETA_FACTURAS}/(\d{{4}})/(\d{{2}})/(\d{{2}}/[^/]+)$')
+
+
+def ubicacion_en_archivo(nombre):
+    """('facturas/archivo/AAAA-MM.zip', 'DD/archivo.pdf') para una factura fragmentada; si no, None."""
+    m = _FRAGMENTADA.match(nombre or '')
+    if not m:
+        return None
+    anio, mes, miembro = m.groups()
+    return posixpath.join(CARPETA_ARCHIVO, f'{anio}-{mes}.zip'), miembro
+
+
+class Archivos:
+    """
+    Abre facturas sueltas o dentro de su archivo mensual. Reusa los ZIP ya
+    abiertos: recorrer un mes archivado lee su índice una sola vez.
+    """
+
+    def __init__(self):
+        self._zips = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for abierto in self._zips.values():
+            if abierto:
+                abierto[0].close()
+                abierto[1].close()
+        self._zips.clear()
+
+    def zip(self, nombre_zip):
+        if nombre_zip not in self._zips:
+            try:
+                fp = default_storage.open(nombre_zip, 'rb')
+            except FileNotFoundError:
+                self._zips[nombre_zip] = None
+            else:
+                self._zips[nombre_zip] = (zipfile.ZipFile(fp), fp)
+        abierto = self._zips[nombre_zip]
+        return abierto[0] if abierto else None
+
+    def archivada(self, nombre):
+        ubicacion = ubicacion_en_archivo(nombre)
+        if not ubicacion:
+            return False
+        zf = self.zip(ubicacion[0])
+        return zf is not None and ubicacion[1] in zf.NameToInfo
+
+    def abrir(self, nombre):
+        """Archivo binario de la factura, suelta o archivada. FileNotFoundError si no está."""
+        try:
+            return default_storage.open(nombre, 'rb')
+        except FileNotFoundError:
+            if not self.archivada(nombre):
+                raise
+        archivo, miembro = ubicacion_en_archivo(nombre)
+        return self.zip(archivo).open(miembro)
+
+
+def _escribir(nombre, origen):
+    """Guarda ``origen`` como ``nombre`` reemplazando lo que hubiera (atómico en disco local)."""
+    try:
+        destino = default_storage.path(nombre)
+    except NotImplementedError:
+        if default_storage.exists(nombre):
+            default_storage.delete(nombre)
+        default_storage.save(nombre, File(origen))
+        return
+
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    tmp = f'{destino}.{os.getpid()}.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            shutil.copyfileobj(origen, f, BLOQUE)
+        os.replace(tmp, destino)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def mover(origen, destino):
+    """Mueve un archivo dentro del storage (un rename si es disco local)."""
+    try:
+        ruta_origen, ruta_destino = default_storage.path(origen), default_storage.path(destino)
+    except NotImplementedError:
+        with default_storage.open(origen, 'rb') as f:
+            _escribir(destino, f)
+        default_storage.delete(origen)
+        return
+    os.makedirs(os.path.dirname(ruta_destino), exist_ok=True)
+    os.replace(ruta_origen, ruta_destino)
+
+
+def extraer(nombre):
+    """Devuelve al storage una factura archivada. False si no está en ningún archivo."""
+    with Archivos() as archivos:
+        if not archivos.archivada(nombre):
+            return False
+        with archivos.abrir(nombre) as origen:
+            _escribir(nombre, origen)
+    return True
+
+
+# ==============================================
+#  ARCHIVO MENSUAL
+# ==============================================
+def meses_fragmentados():
+    """[(año, mes), ...] con carpeta en facturas/AAAA/MM, en orden."""
+    meses = []
+    try:
+        anios, _ = default_storage.listdir(CARPETA_FACTURAS)
+    except FileNotFoundError:
+        return meses
+    for anio in anios:
+        if not (len(anio) == 4 and anio.isdigit()):
+            continue
+        for mes in default_storage.listdir(posixpath.join(CARPETA_FACTURAS, anio))[0]:
+            if len(mes) == 2 and mes.isdigit():
+                meses.append((int(anio), int(mes)))
+    return sorted(meses)
+
+
+def archivar_mes(anio, mes):
+    """
+    Empaqueta los PDF sueltos de ``facturas/AAAA/MM`` en su ZIP mensual
+    (sumándolos a lo ya archivado; una factura vuelta a generar reemplaza a
+    la archivada) y borra los sueltos. Devuelve cuántos se archivaron.
+    """
+    carpeta = posixpath.join(CARPETA_FACTURAS, f'{anio:04d}', f'{mes:02d}')
+    sueltas = {}   # miembro 'DD/archivo.pdf' -> nombre en el storage
+    for dia in default_storage.listdir(carpeta)[0]:
+        for archivo in default_storage.listdir(posixpath.join(carpeta, dia))[1]:
+            if archivo.endswith('.pdf'):
+                sueltas[f'{dia}/{archivo}'] = posixpath.join(carpeta, dia, archivo)
+    if not sueltas:
+        return 0
+
+    nombre_zip = posixpath.join(CARPETA_ARCHIVO, f'{anio:04d}-{mes:02d}.zip')
+    with tempfile.TemporaryFile() as tmp:
+        with zipfile.ZipFile(tmp, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=9) as nuevo:
+            with Archivos() as archivos:
+                anterior = archivos.zip(nombre_zip)
+                for info in anterior.infolist() if anterior else []:
+                    if info.filename not in sueltas:
+                        with anterior.open(info) as origen:
+                            _copiar_a_zip(nuevo, info.filename, info.date_time, origen)
+
+            for miembro, nombre in sorted(sueltas.items()):
+                fecha = default_storage.get_modified_time(nombre).timetuple()[:6]
+                with default_storage.open(nombre, 'rb') as origen:
+                    _copiar_a_zip(nuevo, miembro, fecha, origen)
+
+        # No se borra nada hasta comprobar que el ZIP se lee completo
+        tmp.seek(0)
+        with zipfile.ZipFile(tmp) as prueba:
+            if prueba.testzip() is not None:
+                raise zipfile.BadZipFile(f'{nombre_zip} quedó dañado; no se borró ningún PDF')
+        tmp.seek(0)
+        _escribir(nombre_zip, tmp)
+
+    for nombre in sueltas.values():
+        default_storage.delete(nombre)
+    _borrar_carpetas_vacias(carpeta)
+    return len(sueltas)
+
+
+def _copiar_a_zip(zf, miembro, fecha, origen):
+    info = zipfile.ZipInfo(miembro, date_time=fecha)
+    info.compress_type = zipfile.ZIP_DEFLATED
+    with zf.open(info, 'w', force_zip64=True) as destino:
+        shutil.copyfileobj(origen, destino, BLOQUE)
+
+
+def _borrar_carpetas_vacias(carpeta):
+    try:
+        raiz = default_storage.path(carpeta)
+    except NotImplementedError:
+        return   # los storages remotos no tienen carpetas
+    # Los días del mes, el mes y, si quedó vacío, el año
+    carpetas = [actual for actual, _, _ in os.walk(raiz, topdown=False)] + [os.path.dirname(raiz)]
+    for actual in carpetas:
+        try:
+            os.rmdir(actual)
+        except OSError:
+            pass
@@ -2,4 +2,8 @@ from django.apps import AppConfig
 
 class PedidosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'pedidos'
\ No newline at end of file
+    name = 'pedidos'
+
+    def ready(self):
+        # Conecta la publicación de cambios para el tablero de cocina
+        from . import signals  # noqa: F401
@@ -0,0 +1,91 @@
+# pedidos/cocina.py
+"""
+Registro de cambios del tablero de cocina.
+
+Cada pedido nuevo y cada cambio de ``estado`` inserta un delta compacto en
+EventoCocina; su id es la versión de cocina (igual que el registro del
+inventario, ver productos/versiones.py). ``pedidos.eventos`` los reparte por
+SSE: las pantallas de cocina y el dashboard se enteran sin volver a
+consultar los pedidos.
+
+Delta de un cambio de estado::
+
+    {"id": 12, "e": "listo", "a": "preparando", "d": "2026-10-18"}
+
+``a`` es el estado anterior (None si el pedido es nuevo) y ``d`` el día local
+del pedido (el dashboard sólo cuenta los de hoy). Un pedido nuevo trae además
+``n`` con lo que hace falta para dibujar su tarjeta.
+"""
+from django.utils import timezone
+from django.utils.formats import date_format
+
+from productos.versiones import registrar_evento, ultimo_evento
+
+from .models import EventoCocina, Pedido
+
+MAX_VERSIONES_DELTA = 200
+EVENTOS_CONSERVADOS = 1000
+
+
+def version_cocina():
+    """Versión del tablero de cocina: id del último EventoCocina."""
+    return ultimo_evento(EventoCocina)
+
+
+def _tarjeta(pedido):
+    detalles = pedido.detallepedido_set.select_related('producto').order_by('id')
+    return {
+        'c': pedido.usuario.nombre or pedido.usuario.email,
+        'f': date_format(timezone.localtime(pedido.fecha), 'd/m/Y H:i'),
+        't': pedido.get_tipo_entrega_display(),
+        'p': pedido.get_metodo_pago_display(),
+        'total': str(pedido.total),
+        'dir': pedido.direccion_entrega or '',
+        'desc': str(pedido.descuento_aplicado) if pedido.descuento_aplicado > 0 else '',
+        'i': [[d.producto.nombre, d.cantidad] for d in detalles],
+    }
+
+
+def publicar_cambio(pedido_id, anterior=None, nuevo=False):
+    """
+    Registra el cambio del pedido y devuelve la nueva versión. Se llama al
+    confirmar la transacción (ver pedidos/signals.py): para un pedido nuevo
+    los detalles ya están guardados.
+    """
+    pedido = Pedido.objects.select_related('usuario').filter(id=pedido_id).first()
+    if pedido is None:
+        return None
+
+    delta = {
+        'id': pedido.id,
+        'e': pedido.estado,
+        'a': anterior,
+        'd': timezone.localdate(pedido.fecha).isoformat(),
+    }
+    if nuevo:
+        delta['n'] = _tarjeta(pedido)
+
+    return registrar_evento(EventoCocina, EVENTOS_CONSERVADOS, datos=delta).id
+
+
+def cambios_desde(desde, hasta=None):
+    """
+    Deltas publicados después de la versión ``desde`` (hasta ``hasta``, por
+    defecto la actual), en orden. None si no se puede saber (la versión es
+    demasiado vieja o falta algún evento intermedio): la pantalla tiene que
+    recargar lo que muestra.
+    """
+    if hasta is None:
+        hasta = version_cocina()
+    if desde > hasta or hasta - desde > MAX_VERSIONES_DELTA:
+        return None
+    if desde == hasta:
+        return []
+
+    cambios = list(
+        EventoCocina.objects.filter(id__gt=desde, id__lte=hasta).order_by('id').values_list('datos', flat=True)
+    )
+    # Los ids son consecutivos: si falta uno (evento podado) no hay delta fiable
+    if len(cambios) != hasta - desde:
+        return None
+    return cambios
@@ -0,0 +1,143 @@
+# pedidos/descargas.py
+"""
+Entrega de archivos del storage con validación condicional (ETag /
+Last-Modified → 304) y rangos de bytes (206). El visor de PDF del navegador
+revalida sin volver a bajar el archivo y puede pedirlo por partes.
+"""
+import mimetypes
+import re
+
+from asgiref.sync import sync_to_async
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+BLOQUE = 64 * 1024
+_RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangoInvalido(Exception):
+    pass
+
+
+def contenido_streaming(request, iterador):
+    """
+    Contenido para un ``StreamingHttpResponse`` a partir de un iterador
+    síncrono. Bajo WSGI se usa tal cual. Bajo ASGI Django lo consumiría
+    entero con ``sync_to_async(list)`` antes de mandar el primer byte (un
+    ZIP de mil facturas, todo en memoria): se envuelve en un iterador
+    asíncrono que pide cada bloque en el hilo de la petición.
+    """
+    if not isinstance(request, ASGIRequest):
+        return iterador
+    return _asincrono(iterador)
+
+
+async def _asincrono(iterador):
+    siguiente = sync_to_async(next, thread_sensitive=True)
+    fin = object()
+    try:
+        while (bloque := await siguiente(iterador, fin)) is not fin:
+            yield bloque
+    finally:
+        # Si el cliente corta la descarga, el generador cierra sus archivos
+        cerrar = getattr(iterador, 'close', None)
+        if cerrar is not None:
+            await sync_to_async(cerrar, thread_sensitive=True)()
+
+
+def _rango(cabecera, tamano):
+    """
+    (inicio, fin) inclusivos del rango pedido. None si hay que mandar el
+    archivo completo (sintaxis desconocida o varios rangos: se ignora la
+    cabecera, como permite el RFC 9110).
+    """
+    m = _RANGO.match(cabecera.strip())
+    if not m or m.groups() == ('', ''):
+        return None
+    inicio, fin = m.groups()
+    if not inicio:
+        # 'bytes=-N': los últimos N bytes
+        if int(fin) == 0:
+            raise RangoInvalido
+        return max(tamano - int(fin), 0), tamano - 1
+
+    inicio = int(inicio)
+    if fin and int(fin) < inicio:
+        return None
+    if inicio >= tamano:
+        raise RangoInvalido
+    fin = min(int(fin), tamano - 1) if fin else tamano - 1
+    return inicio, fin
+
+
+def _if_range_vigente(request, etag, modificado):
+    """If-Range: sólo se respeta el rango si el cliente tiene esta misma versión."""
+    condicion = request.headers.get('If-Range')
+    if not condicion:
+        return True
+    if condicion.startswith('"') or condicion.startswith('W/'):
+        return condicion == etag
+    return parse_http_date_safe(condicion) == modificado
+
+
+def _leer(archivo, inicio, longitud):
+    try:
+        archivo.seek(inicio)
+        while longitud > 0:
+            datos = archivo.read(min(BLOQUE, longitud))
+            if not datos:
+                break
+            longitud -= len(datos)
+            yield datos
+    finally:
+        archivo.close()
+
+
+def servir_archivo(request, nombre, descargar_como=None):
+    """
+    Respuesta para el archivo ``nombre`` del storage: 304 si el cliente ya
+    lo tiene, 206 para un rango, 416 si el rango no existe y 200 si no.
+    """
+    tamano = default_storage.size(nombre)
+    modificado = int(default_storage.get_modified_time(nombre).timestamp())
+    etag = quote_etag(f'{modificado:x}-{tamano:x}')
+
+    respuesta = get_conditional_response(request, etag=etag, last_modified=modificado)
+    if respuesta is None:
+        respuesta = _respuesta_archivo(request, nombre, tamano, etag, modificado, descargar_como)
+
+    respuesta.headers['ETag'] = etag
+    respuesta.headers['Last-Modified'] = http_date(modificado)
+    respuesta.headers['Accept-Ranges'] = 'bytes'
+    return respuesta
+
+
+def _respuesta_archivo(request, nombre, tamano, etag, modificado, descargar_como):
+    rango = None
+    cabecera = request.headers.get('Range')
+    if cabecera and request.method == 'GET' and _if_range_vigente(request, etag, modificado):
+        try:
+            rango = _rango(cabecera, tamano)
+        except RangoInvalido:
+            respuesta = HttpResponse(status=416)
+            respuesta.headers['Content-Range'] = f'bytes */{tamano}'
+            return respuesta
+
+    archivo = default_storage.open(nombre, 'rb')
+    if rango is None:
+        return FileResponse(archivo, as_attachment=bool(descargar_como), filename=descargar_como or '')
+
+    inicio, fin = rango
+    respuesta = StreamingHttpResponse(
+        contenido_streaming(request, _leer(archivo, inicio, fin - inicio + 1)),
+        status=206,
+        content_type=mimetypes.guess_type(nombre)[0] or 'application/octet-stream',
+    )
+    respuesta.headers['Content-Length'] = str(fin - inicio + 1)
+    respuesta.headers['Content-Range'] = f'bytes {inicio}-{fin}/{tamano}'
+    if descargar_como:
+        respuesta.headers['Content-Disposition'] = content_disposition_header(True, descargar_como)
+    return respuesta
@@ -0,0 +1,86 @@
+# pedidos/eventos.py
+"""
+Difusión del tablero de cocina por Server-Sent Events.
+
+Mismo esquema que el stock (``productos.eventos.Difusor``): UN vigilante por
+proceso mira la versión de cocina (contador de EventoCocina, en la caché
+compartida) y reparte cada delta, ya serializado, a todas las pantallas
+abiertas. Las tablets dejan de consultar los pedidos cada 30 segundos; la
+base sólo se consulta cuando hay eventos nuevos.
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+
+from productos.eventos import INTERVALO_PING, Difusor
+
+from .cocina import cambios_desde, version_cocina
+
+
+def formatear_evento(version, cambios):
+    datos = json.dumps({'p': cambios}, separators=(',', ':'))
+    return f'id: {version}\nevent: pedido\ndata: {datos}\n\n'
+
+
+def formatear_recarga(version):
+    # Se perdió parte del registro: la pantalla vuelve a pedir lo que muestra
+    return f'id: {version}\nevent: recargar\ndata: {{}}\n\n'
+
+
+def _eventos_desde(desde):
+    """(versión, evento SSE o None si no hubo cambios) con lo publicado después de ``desde``."""
+    version = version_cocina()
+    cambios = cambios_desde(desde, version)
+    if cambios is None:
+        return version, formatear_recarga(version)
+    return version, formatear_evento(version, cambios) if cambios else None
+
+
+class DifusorCocina(Difusor):
+    """Reparte los cambios de pedidos a todas las conexiones del proceso."""
+
+    def leer_version(self):
+        return version_cocina()
+
+    def armar_evento(self, desde, actual):
+        # Un evento visible implica que los anteriores ya se confirmaron
+        # (registrar_evento), así que el delta hasta ``actual`` está completo
+        cambios = cambios_desde(desde, actual)
+        if cambios is None:
+            return formatear_recarga(actual)
+        return formatear_evento(actual, cambios)
+
+
+difusor = DifusorCocina()
+
+
+async def stream_cocina(ultima_version=None):
+    """
+    Generador asíncrono de eventos SSE. Al conectar se informa la versión
+    actual (el ``id`` con el que reconectará el navegador); si reconecta con
+    ``Last-Event-ID`` primero recibe lo que se perdió mientras estuvo fuera.
+    """
+    cola = difusor.suscribir()
+    try:
+        yield 'retry: 3000\n\n'
+
+        if ultima_version is None:
+            version = await sync_to_async(version_cocina)()
+            yield f'id: {version}\n\n'
+        else:
+            version, evento = await sync_to_async(_eventos_desde)(ultima_version)
+            if evento:
+                yield evento
+
+        while True:
+            try:
+                evento = await asyncio.wait_for(cola.get(), timeout=INTERVALO_PING)
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'
+                continue
+            if evento is None:
+                break
+            yield evento
+    finally:
+        difusor.desuscribir(cola)
@@ -0,0 +1,102 @@
+# pedidos/exportacion.py
+"""
+Exportación de facturas en un ZIP que se arma mientras se envía: cada PDF se
+lee por bloques y se comprime directo hacia la respuesta (o el archivo), así
+mil facturas cuestan la misma memoria que una. Las que faltan se generan en
+el camino con ``asegurar_factura``.
+"""
+import posixpath
+import zipfile
+
+from django.utils import timezone
+
+from .almacen import Archivos
+from .facturas import asegurar_factura
+from .models import Pedido
+
+LOTE = 200
+BLOQUE = 64 * 1024
+
+
+class _Salida:
+    """
+    Destino de ``zipfile`` que sólo guarda lo escrito hasta que se entrega.
+    No tiene ``seek``/``tell``: zipfile escribe en modo streaming (con
+    descriptores de datos) y nunca vuelve atrás.
+    """
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self._partes)
+        self._partes.clear()
+        return datos
+
+
+def pedidos_facturables(desde, hasta):
+    """Pedidos entre las fechas ``desde`` y ``hasta`` (incluidas), sin los cancelados."""
+    return Pedido.objects.filter(fecha__date__gte=desde, fecha__date__lte=hasta).exclude(estado='cancelado')
+
+
+def _por_lotes(pedidos):
+    ultimo_id = 0
+    while True:
+        lote = list(pedidos.filter(id__gt=ultimo_id).select_related('usuario').order_by('id')[:LOTE])
+        if not lote:
+            return
+        yield from lote
+        ultimo_id = lote[-1].id
+
+
+def _abrir_factura(pedido, archivos):
+    """
+    (nombre, archivo abierto) del PDF del pedido, suelto o leído de su ZIP
+    mensual (los meses archivados no se extraen al disco). Si falta, se genera.
+    """
+    if pedido.factura_disponible:
+        try:
+            return pedido.factura_pdf.name, archivos.abrir(pedido.factura_pdf.name)
+        except FileNotFoundError:
+            pass
+    nombre = asegurar_factura(pedido)
+    return nombre, archivos.abrir(nombre)
+
+
+def zip_facturas(pedidos):
+    """
+    Generador de bytes del ZIP con la factura de cada pedido. Si alguna no
+    se pudo generar, el ZIP incluye ERRORES.txt con el detalle.
+    """
+    salida = _Salida()
+    errores = []
+    with zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_DEFLATED) as zf, Archivos() as archivos:
+        for pedido in _por_lotes(pedidos):
+            try:
+                nombre, origen = _abrir_factura(pedido, archivos)
+            except Exception as e:
+                errores.append(f'Pedido {pedido.id}: {type(e).__name__}: {e}')
+                continue
+
+            info = zipfile.ZipInfo(
+                posixpath.basename(nombre), date_time=timezone.localtime(pedido.fecha).timetuple()[:6],
+            )
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with origen, zf.open(info, 'w', force_zip64=True) as destino:
+                for bloque in iter(lambda: origen.read(BLOQUE), b''):
+                    destino.write(bloque)
+                    datos = salida.vaciar()
+                    if datos:
+                        yield datos
+
+        if errores:
+            zf.writestr('ERRORES.txt', '\n'.join(errores))
+    # Al cerrar se escribe el directorio central
+    yield salida.vaciar()
@@ -0,0 +1,185 @@
+# pedidos/facturas.py
+"""
+Generación de facturas fuera del checkout.
+
+Con ``FACTURAS_BAJO_DEMANDA`` (por defecto) el PDF se dibuja la primera vez
+que el cliente lo descarga (``asegurar_factura``): quien nunca la pide no
+cuesta ni ReportLab ni disco. Si no, el checkout sólo encola
+(``encolar_factura``) dentro de su transacción y el PDF lo dibuja el worker
+``manage.py generar_facturas``. En ambos casos ni la latencia del pago ni
+los bloqueos de stock incluyen el trabajo de ReportLab.
+"""
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from inventario.utils_factura import generar_factura_pdf
+from .almacen import extraer
+from .models import Pedido, TrabajoFactura
+
+MAX_INTENTOS = 5
+ESPERA_REINTENTO = 30                   # segundos; se duplica en cada intento
+TRABAJO_COLGADO = timedelta(minutes=10)  # 'procesando' sin avance: el worker murió
+BAJO_DEMANDA = getattr(settings, 'FACTURAS_BAJO_DEMANDA', True)
+
+
+def ruta_relativa(factura_url):
+    """'/media/facturas/x.pdf' → 'facturas/x.pdf' (lo que se guarda en ``factura_pdf``)."""
+    if factura_url and factura_url.startswith(settings.MEDIA_URL):
+        return factura_url[len(settings.MEDIA_URL):] or None
+    return None
+
+
+def huella(archivo):
+    """(tamaño, sha256) de un archivo abierto en binario."""
+    sha = hashlib.sha256()
+    tamano = 0
+    for bloque in iter(lambda: archivo.read(64 * 1024), b''):
+        sha.update(bloque)
+        tamano += len(bloque)
+    return tamano, sha.hexdigest()
+
+
+def huella_archivo(nombre):
+    """(tamaño, sha256) del archivo ``nombre`` en el storage."""
+    with default_storage.open(nombre, 'rb') as f:
+        return huella(f)
+
+
+CAMPOS_ARCHIVO = ['factura_pdf', 'factura_tamano', 'factura_sha256']
+
+
+def registrar_archivo(pedido, factura_url):
+    """
+    Asocia al pedido el PDF recién escrito con su tamaño y sha256 (no
+    guarda; usar ``CAMPOS_ARCHIVO`` en update_fields/bulk_update).
+    """
+    nombre = ruta_relativa(factura_url)
+    if not nombre:
+        return False
+    pedido.factura_pdf = nombre
+    pedido.factura_tamano, pedido.factura_sha256 = huella_archivo(nombre)
+    return True
+
+
+def encolar_factura(pedido):
+    """Agrega el pedido a la cola. Llamar dentro de la transacción del pedido."""
+    trabajo, _ = TrabajoFactura.objects.get_or_create(pedido=pedido)
+    return trabajo
+
+
+def asegurar_factura(pedido):
+    """
+    Nombre en el storage de la factura del pedido, dibujándola si falta.
+    El bloqueo de la fila del pedido hace que varios clics simultáneos la
+    generen una sola vez: los demás esperan y encuentran el archivo.
+    """
+    # Sólo se mira el storage al descargar, nunca al listar pedidos
+    if pedido.factura_disponible and default_storage.exists(pedido.factura_pdf.name):
+        return pedido.factura_pdf.name
+
+    with transaction.atomic():
+        pedido = (
+            Pedido.objects.select_for_update(of=('self',))
+            .select_related('usuario').get(id=pedido.id)
+        )
+        if pedido.factura_disponible and default_storage.exists(pedido.factura_pdf.name):
+            return pedido.factura_pdf.name
+        # Archivada en su ZIP mensual: se devuelve a su lugar sin volver a dibujarla
+        if pedido.factura_disponible and extraer(pedido.factura_pdf.name):
+            return pedido.factura_pdf.name
+
+        registrar_archivo(pedido, generar_factura_pdf(pedido))
+        pedido.save(update_fields=CAMPOS_ARCHIVO)
+        # Si además estaba en la cola, el worker ya no tiene nada que hacer
+        TrabajoFactura.objects.filter(pedido=pedido).exclude(estado='lista').update(
+            estado='lista', ultimo_error='', actualizado_en=timezone.now(),
+        )
+    return pedido.factura_pdf.name
+
+
+def tomar_trabajos(lote=10):
+    """
+    Reserva hasta ``lote`` trabajos listos para correr y los marca como
+    'procesando'. Con ``skip_locked`` varios workers pueden tomar de la misma
+    cola sin pisarse.
+    """
+    ahora = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            TrabajoFactura.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(estado='pendiente', disponible_en__lte=ahora)
+                | Q(estado='procesando', actualizado_en__lt=ahora - TRABAJO_COLGADO)
+            )
+            .order_by('disponible_en')
+            .values_list('id', flat=True)[:lote]
+        )
+        TrabajoFactura.objects.filter(id__in=ids).update(
+            estado='procesando', intentos=F('intentos') + 1, actualizado_en=ahora,
+        )
+    return list(TrabajoFactura.objects.select_related('pedido__usuario').filter(id__in=ids).order_by('id'))
+
+
+def procesar_trabajo(trabajo):
+    """
+    Genera el PDF y lo asocia al pedido. Si falla, lo devuelve a la cola con
+    espera exponencial; tras ``MAX_INTENTOS`` queda como 'fallida'.
+    Devuelve True si la factura quedó lista.
+    """
+    pedido = trabajo.pedido
+    try:
+        factura_url = generar_factura_pdf(pedido)
+    except Exception as e:
+        trabajo.estado = 'fallida' if trabajo.intentos >= MAX_INTENTOS else 'pendiente'
+        trabajo.ultimo_error = f'{type(e).__name__}: {e}'
+        trabajo.disponible_en = timezone.now() + timedelta(
+            seconds=ESPERA_REINTENTO * 2 ** max(trabajo.intentos - 1, 0)
+        )
+        trabajo.save(update_fields=['estado', 'ultimo_error', 'disponible_en', 'actualizado_en'])
+        return False
+
+    if registrar_archivo(pedido, factura_url):
+        pedido.save(update_fields=CAMPOS_ARCHIVO)
+
+    trabajo.estado = 'lista'
+    trabajo.ultimo_error = ''
+    trabajo.save(update_fields=['estado', 'ultimo_error', 'actualizado_en'])
+    return True
+
+
+def regenerar_facturas(ids, solo_faltantes=False):
+    """
+    Vuelve a dibujar las facturas de los pedidos ``ids`` (lo usa
+    ``manage.py regenerar_facturas`` desde sus procesos). Con
+    ``solo_faltantes`` salta los pedidos con PDF registrado (correr antes
+    ``manage.py verificar_facturas`` si el disco pudo cambiar).
+    Devuelve (generadas, omitidas, [(pedido_id, error), ...]).
+    """
+    generadas, cambiados, errores = [], [], []
+    omitidas = 0
+    for pedido in Pedido.objects.select_related('usuario').filter(id__in=ids).order_by('id'):
+        if solo_faltantes and pedido.factura_disponible:
+            omitidas += 1
+            continue
+        try:
+            factura_url = generar_factura_pdf(pedido)
+        except Exception as e:
+            errores.append((pedido.id, f'{type(e).__name__}: {e}'))
+            continue
+
+        generadas.append(pedido.id)
+        if registrar_archivo(pedido, factura_url):
+            cambiados.append(pedido)
+
+    Pedido.objects.bulk_update(cambiados, CAMPOS_ARCHIVO)
+    # Lo que la cola dio por perdido ya tiene su PDF
+    TrabajoFactura.objects.filter(pedido_id__in=generadas, estado='fallida').update(
+        estado='lista', ultimo_error='', actualizado_en=timezone.now(),
+    )
+    return len(generadas), omitidas, errores
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from pedidos.almacen import archivar_mes, meses_fragmentados
+
+
+class Command(BaseCommand):
+    help = (
+        'Empaqueta en facturas/archivo/AAAA-MM.zip las facturas de los meses '
+        'con más de N meses de antigüedad y borra los PDF sueltos. La descarga '
+        'las extrae del ZIP cuando hace falta.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meses', type=int, default=6,
+                            help='Meses recientes que se dejan sin archivar')
+
+    def handle(self, *args, **options):
+        hoy = timezone.localdate()
+        # Primer mes que NO se archiva, como (año, mes)
+        total = hoy.year * 12 + hoy.month - 1 - options['meses']
+        limite = (total // 12, total % 12 + 1)
+
+        archivadas = 0
+        for anio, mes in meses_fragmentados():
+            if (anio, mes) >= limite:
+                break
+            cantidad = archivar_mes(anio, mes)
+            if cantidad:
+                self.stdout.write(f'  {anio}-{mes:02d}: {cantidad} facturas archivadas')
+                archivadas += cantidad
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{archivadas} facturas archivadas (meses anteriores a {limite[0]}-{limite[1]:02d})'
+        ))
@@ -0,0 +1,43 @@
+import os
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pedidos.exportacion import pedidos_facturables, zip_facturas
+
+
+class Command(BaseCommand):
+    help = (
+        'Exporta en un ZIP las facturas de los pedidos entre dos fechas (incluidas). '
+        'Genera las que falten; la memoria no crece con la cantidad de facturas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', required=True, help='AAAA-MM-DD')
+        parser.add_argument('--hasta', required=True, help='AAAA-MM-DD')
+        parser.add_argument('-o', '--salida', help='Archivo ZIP (por defecto facturas_<desde>_<hasta>.zip)')
+
+    def handle(self, *args, **options):
+        try:
+            desde = date.fromisoformat(options['desde'])
+            hasta = date.fromisoformat(options['hasta'])
+        except ValueError as e:
+            raise CommandError(f'Fecha inválida: {e}')
+        if desde > hasta:
+            raise CommandError('--desde no puede ser posterior a --hasta')
+
+        pedidos = pedidos_facturables(desde, hasta)
+        ruta = options['salida'] or f'facturas_{desde}_{hasta}.zip'
+        self.stdout.write(f'{pedidos.count()} pedidos entre {desde} y {hasta} → {ruta}')
+
+        tmp = f'{ruta}.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                for datos in zip_facturas(pedidos):
+                    f.write(datos)
+            os.replace(tmp, ruta)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+        self.stdout.write(self.style.SUCCESS(f'ZIP listo: {ruta} ({os.path.getsize(ruta) / 1024:.1f} KB)'))
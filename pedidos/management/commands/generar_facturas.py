@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pedidos.facturas import procesar_trabajo, tomar_trabajos
+
+
+class Command(BaseCommand):
+    help = 'Worker de la cola de facturas: genera los PDF pendientes (--cada N para dejarlo corriendo)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cada', type=float, default=0,
+                            help='Consultar la cola cada N segundos en lugar de vaciarla una sola vez')
+        parser.add_argument('--lote', type=int, default=10,
+                            help='Trabajos que se toman por vuelta')
+
+    def handle(self, *args, **options):
+        cada = options['cada']
+        while True:
+            trabajos = tomar_trabajos(options['lote'])
+            for trabajo in trabajos:
+                if procesar_trabajo(trabajo):
+                    self.stdout.write(self.style.SUCCESS(f'Factura generada: pedido {trabajo.pedido_id}'))
+                else:
+                    self.stderr.write(
+                        f'Error en la factura del pedido {trabajo.pedido_id} '
+                        f'(intento {trabajo.intentos}, {trabajo.estado}): {trabajo.ultimo_error}'
+                    )
+
+            if trabajos:
+                continue
+            if not cada:
+                break
+            time.sleep(cada)
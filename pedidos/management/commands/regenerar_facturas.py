@@ -0,0 +1,145 @@
+import json
+import os
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from pedidos.facturas import regenerar_facturas
+from pedidos.models import Pedido
+
+INTERVALO_REPORTE = 5   # segundos entre líneas de progreso
+
+
+class Command(BaseCommand):
+    help = (
+        'Regenera facturas PDF en paralelo (un proceso por núcleo). Por defecto '
+        'sólo las que faltan; --todas tras cambiar el diseño. Guarda un punto '
+        'de control: si se interrumpe, volver a correrlo continúa donde quedó.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todas', action='store_true',
+                            help='Regenerar también las facturas que ya existen')
+        parser.add_argument('--desde', type=int, default=0, help='Primer id de pedido')
+        parser.add_argument('--hasta', type=int, help='Último id de pedido')
+        parser.add_argument('--procesos', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--lote', type=int, default=100, help='Pedidos por tarea')
+        # Fuera del repositorio: el avance es de esta máquina, no se versiona
+        parser.add_argument('--checkpoint', default=os.path.join(tempfile.gettempdir(), 'bullburger_regenerar_facturas.json'),
+                            help='Archivo donde se guarda el avance')
+        parser.add_argument('--reiniciar', action='store_true',
+                            help='Ignorar el punto de control y empezar desde --desde')
+
+    def handle(self, *args, **options):
+        ruta = options['checkpoint']
+        solo_faltantes = not options['todas']
+        procesos = max(options['procesos'], 1)
+
+        ultimo_id = max(options['desde'] - 1, 0)
+        if not options['reiniciar'] and os.path.exists(ruta):
+            with open(ruta) as f:
+                avance = json.load(f)
+            if avance['todas'] != options['todas'] or avance['hasta'] != options['hasta']:
+                raise CommandError(
+                    f'El punto de control {ruta} es de otra corrida '
+                    f'(--todas={avance["todas"]}, --hasta={avance["hasta"]}). Usar --reiniciar.'
+                )
+            ultimo_id = avance['ultimo_id']
+            self.stdout.write(f'Continuando después del pedido {ultimo_id}')
+
+        pedidos = Pedido.objects.order_by('id')
+        if options['hasta']:
+            pedidos = pedidos.filter(id__lte=options['hasta'])
+        total = pedidos.filter(id__gt=ultimo_id).count()
+        self.stdout.write(f'{total} pedidos por revisar con {procesos} procesos')
+
+        generadas = omitidas = fallidas = 0
+        inicio = ultimo_reporte = time.monotonic()
+
+        # 'spawn': los hijos no heredan las conexiones a la base del padre
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=procesos, mp_context=get_context('spawn'), initializer=django.setup,
+        ) as pool:
+            lotes = self._lotes(pedidos, ultimo_id, options['lote'])
+            pendientes = {}          # futuro -> último id de su lote
+            enviados = deque()       # últimos ids de los lotes, en orden
+            terminados = set()
+
+            while True:
+                # Sólo unos pocos lotes en vuelo: los ids se leen a medida que se usan
+                while len(pendientes) < procesos * 2:
+                    ids = next(lotes, None)
+                    if ids is None:
+                        break
+                    futuro = pool.submit(regenerar_facturas, ids, solo_faltantes)
+                    pendientes[futuro] = ids[-1]
+                    enviados.append(ids[-1])
+                if not pendientes:
+                    break
+
+                listos, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+                for futuro in listos:
+                    terminados.add(pendientes.pop(futuro))
+                    hechas, saltadas, errores = futuro.result()
+                    generadas += hechas
+                    omitidas += saltadas
+                    fallidas += len(errores)
+                    for pedido_id, error in errores:
+                        self.stderr.write(f'Pedido {pedido_id}: {error}')
+
+                # El punto de control avanza hasta el primer lote sin terminar
+                avanzo = False
+                while enviados and enviados[0] in terminados:
+                    ultimo_id = enviados.popleft()
+                    terminados.discard(ultimo_id)
+                    avanzo = True
+                if avanzo:
+                    self._guardar_avance(ruta, {
+                        'ultimo_id': ultimo_id, 'todas': options['todas'], 'hasta': options['hasta'],
+                    })
+
+                ahora = time.monotonic()
+                if ahora - ultimo_reporte >= INTERVALO_REPORTE:
+                    ultimo_reporte = ahora
+                    self._reportar(generadas, omitidas, fallidas, total, ahora - inicio)
+
+        if os.path.exists(ruta):
+            os.remove(ruta)
+        self._reportar(generadas, omitidas, fallidas, total, time.monotonic() - inicio)
+        estilo = self.style.WARNING if fallidas else self.style.SUCCESS
+        self.stdout.write(estilo(
+            f'Listo: {generadas} generadas, {omitidas} ya existían, {fallidas} con error'
+            + (' (correr de nuevo sin --todas para reintentarlas)' if fallidas else '')
+        ))
+
+    @staticmethod
+    def _lotes(pedidos, desde, tamano):
+        """Ids en bloques por rango (id > último visto): sin OFFSET ni todo en memoria."""
+        while True:
+            ids = list(pedidos.filter(id__gt=desde).values_list('id', flat=True)[:tamano])
+            if not ids:
+                return
+            yield ids
+            desde = ids[-1]
+
+    @staticmethod
+    def _guardar_avance(ruta, avance):
+        tmp = f'{ruta}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(avance, f)
+        os.replace(tmp, ruta)
+
+    def _reportar(self, generadas, omitidas, fallidas, total, segundos):
+        procesados = generadas + omitidas + fallidas
+        self.stdout.write(
+            f'  {procesados}/{total} pedidos en {segundos:.1f} s — '
+            f'{procesados / max(segundos, 1e-6):.1f} pedidos/s, '
+            f'{generadas / max(segundos, 1e-6):.1f} facturas/s'
+        )
@@ -0,0 +1,51 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from inventario.utils_factura import nombre_factura
+from pedidos.almacen import mover
+from pedidos.models import Pedido
+
+
+class Command(BaseCommand):
+    help = (
+        'Mueve las facturas de la carpeta plana media/facturas/ a '
+        'facturas/AAAA/MM/DD/ según la fecha del pedido y actualiza '
+        'Pedido.factura_pdf. Se puede interrumpir y volver a correr.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500)
+
+    def handle(self, *args, **options):
+        movidas = faltantes = 0
+        ultimo_id = 0
+
+        while True:
+            pedidos = list(
+                Pedido.objects.filter(id__gt=ultimo_id).exclude(factura_pdf='').exclude(factura_pdf__isnull=True)
+                .order_by('id').only('id', 'fecha', 'factura_pdf')[:options['lote']]
+            )
+            if not pedidos:
+                break
+            ultimo_id = pedidos[-1].id
+
+            cambiados = []
+            for pedido in pedidos:
+                origen, destino = pedido.factura_pdf.name, nombre_factura(pedido)
+                if origen == destino:
+                    continue
+                if default_storage.exists(origen):
+                    mover(origen, destino)
+                elif not default_storage.exists(destino):
+                    # Sin archivo: lo resuelven verificar_facturas / regenerar_facturas
+                    faltantes += 1
+                    continue
+                # (si ya estaba en destino, una corrida anterior se cortó antes de guardar)
+                pedido.factura_pdf = destino
+                cambiados.append(pedido)
+
+            Pedido.objects.bulk_update(cambiados, ['factura_pdf'])
+            movidas += len(cambiados)
+            self.stdout.write(f'  hasta el pedido {ultimo_id}: {movidas} movidas')
+
+        self.stdout.write(self.style.SUCCESS(f'{movidas} facturas movidas, {faltantes} sin archivo'))
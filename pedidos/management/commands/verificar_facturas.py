@@ -0,0 +1,105 @@
+import posixpath
+from collections import Counter
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from inventario.utils_factura import nombre_factura
+from pedidos.almacen import Archivos
+from pedidos.facturas import CAMPOS_ARCHIVO, huella
+from pedidos.models import Pedido
+
+
+class Command(BaseCommand):
+    help = (
+        'Sincroniza las columnas factura_tamano/factura_sha256 con el storage: '
+        'registra PDFs existentes, marca los que faltan y corrige rutas viejas. '
+        'Lista cada carpeta (y lee cada archivo mensual) una vez en lugar de '
+        'consultar el disco por pedido.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completo', action='store_true',
+                            help='Recalcular el sha256 de todos los archivos (detecta PDFs corruptos)')
+        parser.add_argument('--lote', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self._carpetas = {}
+        self._archivos = Archivos()
+        cuenta = Counter()
+        ultimo_id = 0
+
+        with self._archivos:
+            while True:
+                pedidos = list(
+                    Pedido.objects.filter(id__gt=ultimo_id).order_by('id')
+                    .only('id', 'fecha', *CAMPOS_ARCHIVO)[:options['lote']]
+                )
+                if not pedidos:
+                    break
+                ultimo_id = pedidos[-1].id
+
+                cambiados = [p for p in pedidos if self._verificar(p, options['completo'], cuenta)]
+                Pedido.objects.bulk_update(cambiados, CAMPOS_ARCHIVO)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{cuenta['ok']} correctas, {cuenta['registradas']} registradas, "
+            f"{cuenta['faltantes']} sin archivo, {cuenta['corruptas']} con otro contenido, "
+            f"{cuenta['rutas']} rutas corregidas"
+        ))
+        if cuenta['faltantes'] or cuenta['corruptas']:
+            self.stdout.write('Para volver a generarlas: python manage.py regenerar_facturas')
+
+    def _verificar(self, pedido, completo, cuenta):
+        """Actualiza las columnas del pedido; True si hay que guardarlo."""
+        original = (pedido.factura_pdf.name or '', pedido.factura_tamano, pedido.factura_sha256)
+        nombre = self._normalizar(original[0]) or nombre_factura(pedido)
+
+        if not self._existe(nombre):
+            pedido.factura_tamano, pedido.factura_sha256 = None, ''
+            if original[1] is not None:
+                cuenta['faltantes'] += 1
+            return (pedido.factura_tamano, pedido.factura_sha256) != original[1:]
+
+        pedido.factura_pdf = nombre
+        if original[0] and nombre != original[0]:
+            cuenta['rutas'] += 1
+
+        if pedido.factura_tamano is None or completo:
+            with self._archivos.abrir(nombre) as f:
+                pedido.factura_tamano, pedido.factura_sha256 = huella(f)
+            if original[1] is None:
+                cuenta['registradas'] += 1
+            elif (pedido.factura_tamano, pedido.factura_sha256) != original[1:]:
+                # No es el PDF que se escribió: queda para regenerar_facturas
+                pedido.factura_tamano, pedido.factura_sha256 = None, ''
+                cuenta['corruptas'] += 1
+            else:
+                cuenta['ok'] += 1
+        else:
+            cuenta['ok'] += 1
+
+        return (nombre, pedido.factura_tamano, pedido.factura_sha256) != original
+
+    @staticmethod
+    def _normalizar(nombre):
+        """Rutas guardadas a mano en versiones viejas: 'media/...', absolutas o con '\\'."""
+        nombre = nombre.strip().replace('\\', '/')
+        raiz = str(settings.MEDIA_ROOT).replace('\\', '/').rstrip('/') + '/'
+        if nombre.startswith(raiz):
+            nombre = nombre[len(raiz):]
+        nombre = nombre.lstrip('/')
+        if nombre.startswith('media/'):
+            # Corrige registros antiguos con 'media/' duplicado
+            nombre = nombre[6:]
+        return nombre
+
+    def _existe(self, nombre):
+        carpeta, archivo = posixpath.split(nombre)
+        if carpeta not in self._carpetas:
+            try:
+                self._carpetas[carpeta] = set(default_storage.listdir(carpeta)[1])
+            except OSError:
+                self._carpetas[carpeta] = set()
+        return archivo in self._carpetas[carpeta] or self._archivos.archivada(nombre)
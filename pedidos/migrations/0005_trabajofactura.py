@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:33
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0004_pedido_factura_pdf'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoFactura',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('lista', 'Lista'), ('fallida', 'Fallida')], default='pendiente', max_length=20)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('ultimo_error', models.TextField(blank=True, default='')),
+                ('disponible_en', models.DateTimeField(default=django.utils.timezone.now)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+                ('pedido', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='trabajo_factura', to='pedidos.pedido')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['estado', 'disponible_en'], name='trabajo_factura_cola_idx')],
+            },
+        ),
+    ]
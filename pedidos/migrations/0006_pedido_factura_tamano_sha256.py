@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0005_trabajofactura'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='factura_sha256',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='factura_tamano',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
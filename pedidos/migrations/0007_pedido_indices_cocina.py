@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0006_pedido_factura_tamano_sha256'),
+        ('productos', '0008_claveidempotencia'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['estado', '-fecha'], name='pedido_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['-fecha', '-id'], name='pedido_fecha_id_idx'),
+        ),
+    ]
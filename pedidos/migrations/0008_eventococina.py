@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0007_pedido_indices_cocina'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoCocina',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('datos', models.JSONField()),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
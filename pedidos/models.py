@@ -1,9 +1,8 @@
 from django.db import models
 from productos.models import Producto, Promocion
 from usuarios.models import Usuario
-from django.conf import settings
-from django.core.files.storage import default_storage
-import os
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils import timezone
 
 
 class Pedido(models.Model):
@@ -25,6 +24,9 @@ class Pedido(models.Model):
         ('tarjeta', 'Tarjeta'),
     ]
 
+    # Los que todavía le importan a la cocina
+    ESTADOS_ACTIVOS = ('pendiente', 'preparando', 'listo')
+
     # Relaciones y datos principales
     usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE)
     promocion = models.ForeignKey(Promocion, on_delete=models.SET_NULL, null=True, blank=True)
@@ -43,6 +45,18 @@ class Pedido(models.Model):
 
     # Archivo de factura (guardar SIEMPRE con nombre relativo, p.ej. "facturas/factura_123.pdf")
     factura_pdf = models.FileField(upload_to='facturas/', blank=True, null=True)
+    # Lo que se sabe del archivo sin ir al disco. Lo llena quien escribe el
+    # PDF (pedidos/facturas.py) y lo corrige ``manage.py verificar_facturas``
+    factura_tamano = models.PositiveIntegerField(null=True, blank=True)  # None = sin archivo
+    factura_sha256 = models.CharField(max_length=64, blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # Tablero de cocina: los activos por estado y el historial
+            # paginado por (fecha, id)
+            models.Index(fields=['estado', '-fecha'], name='pedido_estado_fecha_idx'),
+            models.Index(fields=['-fecha', '-id'], name='pedido_fecha_id_idx'),
+        ]
 
     def __str__(self):
         return f"Pedido {self.id} - {self.usuario.email}"
@@ -51,35 +65,12 @@ class Pedido(models.Model):
     @property
     def factura_disponible(self) -> bool:
         """
-        Devuelve True si hay un archivo asociado y realmente existe en el storage
-        o en el sistema de archivos. Soporta casos donde en la base quedó
-        'media/' duplicado o incluso una ruta absoluta.
+        True si hay un PDF registrado para el pedido. Lee las columnas que se
+        llenan al escribir el archivo, sin tocar el storage: el historial de
+        pedidos no hace un stat por fila. La coherencia con el disco la
+        revisa ``manage.py verificar_facturas``.
         """
-        f = self.factura_pdf
-        if not f:
-            return False
-
-        try:
-            # Nombre relativo al storage (lo ideal)
-            name = (f.name or "").strip().lstrip("/").replace("\\", "/")
-            if name.startswith("media/"):
-                # Corrige registros antiguos con 'media/' duplicado
-                name = name[6:]
-
-            # 1) Chequeo en el storage configurado (lo normal)
-            if name and default_storage.exists(name):
-                return True
-
-            # 2) Chequeo directo por path absoluto (por si guardaron la ruta completa)
-            #    Si f.path no existe, construimos: MEDIA_ROOT / name
-            path = getattr(f, "path", None)
-            if not path:
-                path = os.path.join(settings.MEDIA_ROOT, name)
-
-            return os.path.exists(path)
-        except Exception:
-            # Si algo falla, consideramos que no está disponible
-            return False
+        return bool(self.factura_pdf) and self.factura_tamano is not None
 
     @property
     def factura_url(self):
@@ -94,6 +85,14 @@ class Pedido(models.Model):
                 return None
         return None
 
+    @property
+    def factura_generandose(self) -> bool:
+        """True mientras la factura espera en la cola (ver TrabajoFactura)."""
+        try:
+            return self.trabajo_factura.estado in ('pendiente', 'procesando')
+        except ObjectDoesNotExist:
+            return False
+
 
 class DetallePedido(models.Model):
     pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE)
@@ -105,3 +104,47 @@ class DetallePedido(models.Model):
 
     def __str__(self):
         return f"Detalle {self.pedido.id} - {self.producto.nombre}"
+
+
+class TrabajoFactura(models.Model):
+    """
+    Cola de facturas por generar. El checkout inserta la fila en su misma
+    transacción y el comando ``generar_facturas`` la procesa fuera de ella
+    (ver pedidos/facturas.py).
+    """
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('lista', 'Lista'),
+        ('fallida', 'Fallida'),
+    ]
+
+    pedido = models.OneToOneField(Pedido, on_delete=models.CASCADE, related_name='trabajo_factura')
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente')
+    intentos = models.PositiveIntegerField(default=0)
+    ultimo_error = models.TextField(blank=True, default='')
+    # No se toma antes de esta hora (espera entre reintentos)
+    disponible_en = models.DateTimeField(default=timezone.now)
+    creado_en = models.DateTimeField(auto_now_add=True)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['estado', 'disponible_en'], name='trabajo_factura_cola_idx'),
+        ]
+
+    def __str__(self):
+        return f"Factura del pedido {self.pedido_id} ({self.estado})"
+
+
+class EventoCocina(models.Model):
+    """
+    Registro de cambios del tablero de cocina: el id es la versión y
+    ``datos`` el delta que se reparte por SSE (ver pedidos/cocina.py).
+    Se conservan los últimos.
+    """
+    datos = models.JSONField()
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"v{self.id}: pedido {self.datos.get('id')}"
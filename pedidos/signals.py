@@ -0,0 +1,36 @@
+# pedidos/signals.py
+"""
+Publica en el registro de cocina (``pedidos.cocina``) los pedidos nuevos y
+los cambios de ``estado``, al confirmar la transacción: las pantallas nunca
+ven un pedido que después se revirtió ni uno todavía sin detalles.
+"""
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+
+from productos.versiones import al_confirmar
+
+from .cocina import publicar_cambio
+from .models import Pedido
+
+
+def _toca_estado(update_fields):
+    return update_fields is None or 'estado' in update_fields
+
+
+@receiver(pre_save, sender=Pedido)
+def pedido_guardandose(sender, instance, update_fields=None, **kwargs):
+    # Guardar sólo la factura (update_fields) no cuesta la consulta
+    instance._estado_anterior = None
+    if instance.pk and _toca_estado(update_fields):
+        instance._estado_anterior = (
+            Pedido.objects.filter(pk=instance.pk).values_list('estado', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Pedido)
+def pedido_guardado(sender, instance, created, update_fields=None, **kwargs):
+    anterior = getattr(instance, '_estado_anterior', None)
+    if created:
+        al_confirmar(publicar_cambio, instance.pk, nuevo=True)
+    elif _toca_estado(update_fields) and anterior != instance.estado:
+        al_confirmar(publicar_cambio, instance.pk, anterior=anterior)
@@ -1,3 +1,93 @@
-from django.test import TestCase
+import shutil
+import tempfile
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+
+from usuarios.models import Rol, Usuario
+from .cocina import cambios_desde, version_cocina
+from .descargas import RangoInvalido, _rango, servir_archivo
+from .models import Pedido
+
+
+class TableroCocinaTests(TransactionTestCase):
+    # Los eventos se publican al confirmar: transacciones reales
+
+    def setUp(self):
+        cache.clear()
+        rol = Rol.objects.get_or_create(nombre='Cliente')[0]
+        self.usuario = Usuario.objects.create_user('cliente@bullburger.test', 'x', nombre='Cliente', rol=rol)
+
+    def test_primer_evento_es_un_delta(self):
+        # Tablero dibujado antes del primer pedido del registro
+        version = version_cocina()
+        self.assertGreater(version, 0)
+
+        pedido = Pedido.objects.create(usuario=self.usuario)
+
+        cambios = cambios_desde(version)
+        self.assertEqual([c['id'] for c in cambios], [pedido.id])
+        self.assertEqual(cambios[0]['a'], None)
+
+
+class RangoTests(SimpleTestCase):
+
+    def test_rangos(self):
+        self.assertEqual(_rango('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(_rango('bytes=900-', 1000), (900, 999))
+        self.assertEqual(_rango('bytes=-100', 1000), (900, 999))
+        # Fin más allá del archivo: se recorta
+        self.assertEqual(_rango('bytes=950-2000', 1000), (950, 999))
+        self.assertEqual(_rango('bytes=-5000', 1000), (0, 999))
+
+    def test_cabeceras_que_se_ignoran(self):
+        for cabecera in ('bytes=-', 'bytes=0-1,5-9', 'lineas=0-9', 'bytes=9-0'):
+            self.assertIsNone(_rango(cabecera, 1000), cabecera)
+
+    def test_rangos_imposibles(self):
+        for cabecera in ('bytes=1000-', 'bytes=-0'):
+            with self.assertRaises(RangoInvalido):
+                _rango(cabecera, 1000)
+
+
+class ServirArchivoTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media))
+        cls.nombre = default_storage.save('facturas/prueba.pdf', ContentFile(bytes(range(256)) * 4))
+
+    def get(self, **cabeceras):
+        return servir_archivo(RequestFactory().get('/', headers=cabeceras), self.nombre)
+
+    def test_completo(self):
+        respuesta = self.get()
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(len(b''.join(respuesta.streaming_content)), 1024)
+        self.assertEqual(respuesta['Accept-Ranges'], 'bytes')
+        respuesta.close()
+
+    def test_rango_parcial(self):
+        respuesta = self.get(Range='bytes=10-19')
+        self.assertEqual(respuesta.status_code, 206)
+        self.assertEqual(respuesta['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(b''.join(respuesta.streaming_content), bytes(range(10, 20)))
+
+    def test_rango_fuera_del_archivo(self):
+        respuesta = self.get(Range='bytes=5000-')
+        self.assertEqual(respuesta.status_code, 416)
+        self.assertEqual(respuesta['Content-Range'], 'bytes */1024')
+
+    def test_no_modificado(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(If_None_Match=etag).status_code, 304)
+
+    def test_if_range_de_otra_version(self):
+        respuesta = self.get(Range='bytes=10-19', If_Range='"otra"')
+        self.assertEqual(respuesta.status_code, 200)
+        respuesta.close()
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from inventario.models import ComponenteCombo
 from .models import Categoria, Producto
 
 @admin.register(Categoria)
@@ -6,8 +7,19 @@ class CategoriaAdmin(admin.ModelAdmin):
     list_display = ['nombre', 'creado_en']
     search_fields = ['nombre']
 
+class ComponenteComboInline(admin.TabularInline):
+    model = ComponenteCombo
+    fk_name = 'combo'
+    extra = 1
+    verbose_name = 'Producto del combo'
+    verbose_name_plural = 'Productos del combo'
+
+
 @admin.register(Producto)
 class ProductoAdmin(admin.ModelAdmin):
-    list_display = ['nombre', 'precio', 'categoria', 'disponible']
-    list_filter = ['categoria', 'disponible']
-    search_fields = ['nombre']
\ No newline at end of file
+    list_display = ['nombre', 'precio', 'categoria', 'disponible', 'unidades_disponibles', 'disponible_por_stock']
+    list_filter = ['categoria', 'disponible', 'disponible_por_stock']
+    search_fields = ['nombre']
+    # Calculadas a partir de recetas e ingredientes (productos/signals.py)
+    readonly_fields = ['unidades_disponibles', 'disponible_por_stock']
+    inlines = [ComponenteComboInline]
\ No newline at end of file
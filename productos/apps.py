@@ -2,4 +2,8 @@ from django.apps import AppConfig
 
 class ProductosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'productos'
\ No newline at end of file
+    name = 'productos'
+
+    def ready(self):
+        # Conecta la invalidación de la caché de stock
+        from . import signals  # noqa: F401
@@ -0,0 +1,175 @@
+# productos/eventos.py
+"""
+Difusión de cambios de stock por Server-Sent Events.
+
+Cada proceso tiene UN solo vigilante (un hilo, ver ``Difusor``) que mira la
+versión del inventario; cuando cambia, arma el delta una vez y lo reparte a
+todas las conexiones abiertas, cada una en su propio event loop. La versión
+se lee de la caché compartida (``productos.versiones``): cientos de menús
+abiertos cuestan una lectura de caché por segundo por proceso, no una
+consulta por cliente. La base sólo se consulta cuando hay un cambio.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, connection
+
+from .stock import cambios_desde, stock_por_producto_cache, version_inventario
+
+INTERVALO_VIGILANCIA = 1      # segundos entre lecturas de la versión
+INTERVALO_PING = 15           # comentario keep-alive para proxies
+TAMANO_COLA = 20              # eventos pendientes por conexión antes de descartar
+
+logger = logging.getLogger(__name__)
+
+
+class Difusor:
+    """
+    Reparte los eventos de un registro versionado a todas las conexiones del
+    proceso. Las subclases dicen cómo leer la versión (``leer_version``) y
+    cómo armar el evento SSE de lo que cambió (``armar_evento``).
+
+    El vigilante es un hilo y no una tarea de asyncio: sirve a conexiones de
+    cualquier event loop (uno por proceso con ASGI, uno por petición si una
+    vista async corre bajo WSGI) y sigue siendo uno solo. Entrega con
+    ``call_soon_threadsafe`` y termina cuando no queda nadie suscrito.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.suscriptores = {}    # cola → event loop de la conexión
+        self._hilo = None
+
+    def leer_version(self):
+        raise NotImplementedError
+
+    def armar_evento(self, desde, actual):
+        """Evento SSE con lo publicado entre ``desde`` y ``actual`` (None = nada que mandar)."""
+        raise NotImplementedError
+
+    def suscribir(self):
+        cola = asyncio.Queue(maxsize=TAMANO_COLA)
+        with self._lock:
+            self.suscriptores[cola] = asyncio.get_running_loop()
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._vigilar, name=type(self).__name__, daemon=True)
+                self._hilo.start()
+        return cola
+
+    def desuscribir(self, cola):
+        with self._lock:
+            self.suscriptores.pop(cola, None)
+
+    def _vigilar(self):
+        try:
+            version = None
+            while True:
+                with self._lock:
+                    if not self.suscriptores:
+                        # Sin conexiones: la próxima suscripción arranca otro
+                        # hilo desde la versión de ese momento
+                        self._hilo = None
+                        return
+                try:
+                    close_old_connections()
+                    actual = self.leer_version()
+                    if version is not None and actual != version:
+                        evento = self.armar_evento(version, actual)
+                        if evento:
+                            self._repartir(evento)
+                    version = actual
+                except Exception:
+                    # Una caída de la base no mata el vigilante: se reintenta
+                    logger.exception('Error vigilando %s', type(self).__name__)
+                time.sleep(INTERVALO_VIGILANCIA)
+        finally:
+            connection.close()
+
+    def _repartir(self, evento):
+        with self._lock:
+            destinos = list(self.suscriptores.items())
+        for cola, loop in destinos:
+            try:
+                loop.call_soon_threadsafe(self._entregar, cola, evento)
+            except RuntimeError:
+                # Su event loop ya cerró
+                self.desuscribir(cola)
+
+    def _entregar(self, cola, evento):
+        # Corre en el event loop de la conexión
+        try:
+            cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            # Cliente lento: se le cierra el stream y el navegador
+            # reconecta pidiendo lo que le falta (Last-Event-ID)
+            self.desuscribir(cola)
+            while not cola.empty():
+                cola.get_nowait()
+            cola.put_nowait(None)
+
+
+def _delta(desde, version=None):
+    """
+    (versión, {producto_id: unidades}, completo) con lo que cambió después
+    de ``desde`` (hasta ``version``, por defecto la actual). Sin registro de
+    cambios → mapa completo.
+    """
+    if version is None:
+        version = version_inventario()
+    stock = stock_por_producto_cache(version)
+    cambios = None if desde is None else cambios_desde(desde, version)
+    if cambios is None:
+        return version, stock, True
+    return version, {pid: stock[pid] for pid in cambios if pid in stock}, False
+
+
+def formatear_evento(version, stock, completo):
+    datos = json.dumps({'s': stock, 'c': completo}, separators=(',', ':'))
+    return f'id: {version}\nevent: stock\ndata: {datos}\n\n'
+
+
+class DifusorStock(Difusor):
+    """Reparte los deltas de stock a todas las conexiones del proceso."""
+
+    def leer_version(self):
+        return version_inventario()
+
+    def armar_evento(self, desde, actual):
+        version, stock, completo = _delta(desde, actual)
+        if stock or completo:
+            return formatear_evento(version, stock, completo)
+        return None
+
+
+difusor = DifusorStock()
+
+
+async def stream_stock(ultima_version=None):
+    """
+    Generador asíncrono de eventos SSE. Si el navegador reconecta con
+    ``Last-Event-ID`` primero recibe lo que cambió mientras estuvo fuera.
+    """
+    cola = difusor.suscribir()
+    try:
+        yield 'retry: 3000\n\n'
+
+        if ultima_version is not None:
+            version, stock, completo = await sync_to_async(_delta)(ultima_version)
+            if stock or completo:
+                yield formatear_evento(version, stock, completo)
+
+        while True:
+            try:
+                evento = await asyncio.wait_for(cola.get(), timeout=INTERVALO_PING)
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'
+                continue
+            if evento is None:
+                break
+            yield evento
+    finally:
+        difusor.desuscribir(cola)
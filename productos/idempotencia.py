@@ -0,0 +1,122 @@
+# productos/idempotencia.py
+"""
+Cabecera ``Idempotency-Key`` para POST que no se deben ejecutar dos veces
+(el checkout): los reintentos de un cliente móvil con mala conexión reciben
+la respuesta guardada en lugar de crear otro pedido.
+
+- Primera vez: se registra la clave (fila única por usuario) y corre la vista.
+- Clave ya completa: se repite la respuesta guardada.
+- Clave en curso (duplicado simultáneo): se espera a que la primera termine.
+- Misma clave con otro cuerpo: 422.
+
+Los errores 5xx no se guardan: la clave se libera para poder reintentar.
+Las claves vencidas de todos los usuarios se borran aparte
+(``manage.py purgar_idempotencia``, por cron), no en cada solicitud.
+"""
+import hashlib
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import ClaveIdempotencia
+
+IDEMPOTENCIA_TTL = timedelta(hours=getattr(settings, 'IDEMPOTENCIA_HORAS', 24))
+ESPERA_DUPLICADO = 15          # segundos máximos esperando a la solicitud original
+INTERVALO_ESPERA = 0.1
+CLAVE_ABANDONADA = timedelta(minutes=2)   # en curso sin respuesta: el proceso murió
+
+
+def _reclamar(usuario, clave, huella):
+    """
+    (registro, es_nuevo). Si la clave venció o quedó abandonada se reemplaza.
+    """
+    while True:
+        ahora = timezone.now()
+        ClaveIdempotencia.objects.filter(usuario=usuario, clave=clave).filter(
+            Q(expira_en__lt=ahora) | Q(codigo__isnull=True, creado_en__lt=ahora - CLAVE_ABANDONADA)
+        ).delete()
+        try:
+            with transaction.atomic():
+                registro = ClaveIdempotencia.objects.create(
+                    usuario=usuario, clave=clave, huella=huella, expira_en=ahora + IDEMPOTENCIA_TTL,
+                )
+            return registro, True
+        except IntegrityError:
+            registro = ClaveIdempotencia.objects.filter(usuario=usuario, clave=clave).first()
+            if registro is not None:
+                return registro, False
+            # La solicitud original la liberó (5xx) justo después de nuestro
+            # INSERT: la clave está libre otra vez, se vuelve a reclamar
+
+
+def purgar_claves():
+    """Borra las claves vencidas de todos los usuarios. Devuelve cuántas."""
+    borradas, _ = ClaveIdempotencia.objects.filter(expira_en__lt=timezone.now()).delete()
+    return borradas
+
+
+def _esperar(registro):
+    """Espera a que la solicitud original guarde su respuesta."""
+    limite = time.monotonic() + ESPERA_DUPLICADO
+    while time.monotonic() < limite:
+        time.sleep(INTERVALO_ESPERA)
+        registro = ClaveIdempotencia.objects.filter(pk=registro.pk).first()
+        if registro is None or registro.completa:
+            return registro
+    return None
+
+
+def _repetir(registro):
+    respuesta = HttpResponse(registro.respuesta, status=registro.codigo, content_type='application/json')
+    respuesta['Idempotent-Replayed'] = 'true'
+    return respuesta
+
+
+def idempotente(vista):
+    """Decorador: aplica ``Idempotency-Key`` si la solicitud la trae."""
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        clave = request.headers.get('Idempotency-Key', '').strip()
+        if not clave:
+            return vista(request, *args, **kwargs)
+        if len(clave) > 255:
+            return JsonResponse({'ok': False, 'error': 'Idempotency-Key demasiado larga'}, status=400)
+
+        huella = hashlib.sha256(request.body).hexdigest()
+        registro, es_nuevo = _reclamar(request.user, clave, huella)
+
+        if not es_nuevo:
+            if registro.huella != huella:
+                return JsonResponse(
+                    {'ok': False, 'error': 'Idempotency-Key ya usada con otros datos'}, status=422
+                )
+            if not registro.completa:
+                registro = _esperar(registro)
+                if registro is None:
+                    return JsonResponse(
+                        {'ok': False, 'error': 'La solicitud original no terminó, intenta de nuevo'},
+                        status=409,
+                    )
+            return _repetir(registro)
+
+        try:
+            respuesta = vista(request, *args, **kwargs)
+        except Exception:
+            registro.delete()
+            raise
+
+        if respuesta.status_code >= 500:
+            registro.delete()
+        else:
+            registro.codigo = respuesta.status_code
+            registro.respuesta = respuesta.content.decode()
+            registro.save(update_fields=['codigo', 'respuesta'])
+        return respuesta
+
+    return envoltura
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from productos.stock import compactar_consumos
+
+
+class Command(BaseCommand):
+    help = 'Aplica al stock de los ingredientes los consumos pendientes del checkout (INVENTARIO_STOCK_DIFERIDO)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cada', type=float, default=0,
+                            help='Repetir cada N segundos en lugar de una sola vez')
+
+    def handle(self, *args, **options):
+        cada = options['cada']
+        while True:
+            aplicados, sobrevendidos = compactar_consumos()
+            if aplicados:
+                self.stdout.write(self.style.SUCCESS(f'Consumos aplicados: {aplicados}'))
+            for nombre, stock, pendiente in sobrevendidos:
+                # Vendido de más: sus consumos quedan pendientes hasta reponer
+                self.stderr.write(self.style.WARNING(
+                    f'Sobrevendido "{nombre}": stock {stock}, consumos pendientes {pendiente} '
+                    f'(faltan {pendiente - stock})'
+                ))
+            if not cada:
+                break
+            time.sleep(cada)
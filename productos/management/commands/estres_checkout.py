@@ -0,0 +1,159 @@
+import random
+import threading
+from collections import Counter
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Sum
+from django.test import RequestFactory
+
+from inventario.models import Ingrediente, MovimientoInventario, Receta
+from pedidos.models import Pedido
+from productos.models import Categoria, CarritoItem, Producto
+from productos.views import carrito_checkout
+from usuarios.models import Usuario
+
+PREFIJO = '[estres]'
+
+
+class Command(BaseCommand):
+    help = (
+        'Prueba de estrés del checkout: N clientes pagan a la vez bolsas que '
+        'comparten ingredientes (en distinto orden). Falla si alguna respuesta '
+        'es 500 o si el stock no cuadra con los movimientos. Usar contra un '
+        'PostgreSQL local, NUNCA contra producción.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=30)
+        parser.add_argument('--stock', type=int, default=40,
+                            help='Stock inicial de cada ingrediente (bajo = algunos pedidos sin stock)')
+        parser.add_argument('--conservar', action='store_true',
+                            help='No borrar los datos de prueba al terminar')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('La prueba de estrés necesita PostgreSQL (bloqueos de fila reales).')
+
+        clientes, ingredientes, productos = self._preparar(options['clientes'], options['stock'])
+        stock_inicial = {ing.id: ing.stock_actual for ing in ingredientes}
+
+        try:
+            codigos = self._disparar(clientes)
+            self._verificar(codigos, clientes, stock_inicial)
+        finally:
+            if not options['conservar']:
+                self._limpiar(clientes, ingredientes, productos)
+
+    # ==============================================
+    #  DATOS DE PRUEBA
+    # ==============================================
+    def _preparar(self, n_clientes, stock):
+        categoria, _ = Categoria.objects.get_or_create(nombre=f'{PREFIJO} Categoría')
+        ingredientes = [
+            Ingrediente.objects.create(
+                nombre=f'{PREFIJO} Ingrediente {i}', unidad_medida='unidad',
+                stock_actual=Decimal(stock), stock_minimo=Decimal('0'),
+            )
+            for i in range(4)
+        ]
+        # Cada producto usa tres de los cuatro ingredientes
+        productos = []
+        for i in range(4):
+            producto = Producto.objects.create(
+                nombre=f'{PREFIJO} Producto {i}', precio=Decimal('1.00'), categoria=categoria,
+            )
+            for j in range(3):
+                Receta.objects.create(
+                    producto=producto, ingrediente=ingredientes[(i + j) % 4], cantidad=Decimal('1'),
+                )
+            productos.append(producto)
+
+        clientes = []
+        for i in range(n_clientes):
+            cliente = Usuario.objects.create_user(
+                f'estres{i}@bullburger.test', password=None, nombre=f'{PREFIJO} Cliente {i}',
+            )
+            # Orden de la bolsa distinto por cliente: con el bloqueo por orden
+            # de la bolsa esto producía deadlocks
+            for producto in random.sample(productos, k=3):
+                CarritoItem.objects.create(usuario=cliente, producto=producto, cantidad=random.randint(1, 2))
+            clientes.append(cliente)
+
+        return clientes, ingredientes, productos
+
+    def _limpiar(self, clientes, ingredientes, productos):
+        for pedido in Pedido.objects.filter(usuario__in=clientes).exclude(factura_pdf=''):
+            pedido.factura_pdf.delete(save=False)
+        # Borra en cascada pedidos, detalles, movimientos y bolsas
+        Usuario.objects.filter(id__in=[c.id for c in clientes]).delete()
+        Producto.objects.filter(id__in=[p.id for p in productos]).delete()
+        Ingrediente.objects.filter(id__in=[i.id for i in ingredientes]).delete()
+        Categoria.objects.filter(nombre=f'{PREFIJO} Categoría').delete()
+
+    # ==============================================
+    #  CHECKOUTS SIMULTÁNEOS
+    # ==============================================
+    def _disparar(self, clientes):
+        factory = RequestFactory()
+        barrera = threading.Barrier(len(clientes))
+        codigos = Counter()
+        errores = []
+        candado = threading.Lock()
+
+        def pagar(cliente):
+            request = factory.post(
+                '/carrito/checkout/', data='{"metodo": "efectivo", "entrega": "local"}',
+                content_type='application/json',
+            )
+            request.user = cliente
+            barrera.wait()
+            try:
+                respuesta = carrito_checkout(request)
+            finally:
+                connections.close_all()
+            with candado:
+                codigos[respuesta.status_code] += 1
+                if respuesta.status_code >= 500:
+                    errores.append(respuesta.content.decode())
+
+        hilos = [threading.Thread(target=pagar, args=(c,)) for c in clientes]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        for error in errores[:5]:
+            self.stderr.write(error)
+        return codigos
+
+    # ==============================================
+    #  VERIFICACIÓN
+    # ==============================================
+    def _verificar(self, codigos, clientes, stock_inicial):
+        self.stdout.write(f'Respuestas: {dict(codigos)}')
+        fallos = []
+
+        if any(codigo >= 500 for codigo in codigos):
+            fallos.append(f'{sum(n for c, n in codigos.items() if c >= 500)} respuestas 500')
+
+        pedidos = Pedido.objects.filter(usuario__in=clientes).count()
+        if pedidos != codigos[200]:
+            fallos.append(f'{pedidos} pedidos creados para {codigos[200]} respuestas OK')
+
+        salidas = dict(
+            MovimientoInventario.objects.filter(ingrediente_id__in=stock_inicial, tipo='salida')
+            .values('ingrediente_id').annotate(total=Sum('cantidad'))
+            .values_list('ingrediente_id', 'total')
+        )
+        for ing in Ingrediente.objects.filter(id__in=stock_inicial):
+            esperado = stock_inicial[ing.id] - salidas.get(ing.id, 0)
+            if ing.stock_actual != esperado or ing.stock_actual < 0:
+                fallos.append(f'{ing.nombre}: stock {ing.stock_actual}, esperado {esperado}')
+
+        if fallos:
+            raise CommandError('Prueba de estrés FALLIDA:\n  ' + '\n  '.join(fallos))
+        self.stdout.write(self.style.SUCCESS(
+            f'OK: {codigos[200]} pedidos, sin errores 500 y con el stock conservado'
+        ))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from productos.stock import expirar_reservas
+
+
+class Command(BaseCommand):
+    help = 'Libera en bloque las reservas de stock vencidas y las versiones de bolsa sin uso (cron cada minuto o --cada N)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cada', type=int, default=0,
+                            help='Repetir cada N segundos en lugar de una sola vez')
+
+    def handle(self, *args, **options):
+        cada = options['cada']
+        while True:
+            liberadas = expirar_reservas()
+            if liberadas:
+                self.stdout.write(self.style.SUCCESS(f'Reservas liberadas: {liberadas}'))
+            if not cada:
+                break
+            time.sleep(cada)
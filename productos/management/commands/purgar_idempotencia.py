@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from productos.idempotencia import purgar_claves
+
+
+class Command(BaseCommand):
+    help = 'Borra las claves Idempotency-Key vencidas (cron cada hora o --cada N)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cada', type=int, default=0,
+                            help='Repetir cada N segundos en lugar de una sola vez')
+
+    def handle(self, *args, **options):
+        cada = options['cada']
+        while True:
+            borradas = purgar_claves()
+            if borradas:
+                self.stdout.write(self.style.SUCCESS(f'Claves vencidas borradas: {borradas}'))
+            if not cada:
+                break
+            time.sleep(cada)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from productos.models import Producto
+from productos.stock import compilar_materiales, refrescar_disponibilidad, invalidar_recetas
+
+
+class Command(BaseCommand):
+    help = 'Recompila las listas de materiales y reconstruye desde cero la disponibilidad de todos los productos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Productos por transacción')
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+
+        # Recetas y combos → lista de materiales aplanada
+        compilar_materiales()
+
+        ids = list(Producto.objects.order_by('id').values_list('id', flat=True))
+
+        total = 0
+        for i in range(0, len(ids), lote):
+            total += refrescar_disponibilidad(Producto.objects.filter(id__in=ids[i:i + lote]))
+
+        # El mapa en caché pudo haberse calculado con columnas viejas
+        invalidar_recetas()
+
+        self.stdout.write(self.style.SUCCESS(f'Disponibilidad recalculada: {total} productos'))
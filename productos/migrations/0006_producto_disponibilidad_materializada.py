@@ -0,0 +1,56 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:23
+
+from django.db import migrations, models
+
+
+def calcular_disponibilidad(apps, schema_editor):
+    """Llena las columnas nuevas (los modelos históricos no tienen el queryset propio)."""
+    Producto = apps.get_model('productos', 'Producto')
+    Receta = apps.get_model('inventario', 'Receta')
+
+    estado = {}
+    filas = Receta.objects.values_list(
+        'producto_id', 'cantidad', 'ingrediente__stock_actual', 'ingrediente__stock_minimo'
+    )
+    for producto_id, cantidad, stock, minimo in filas:
+        unidades, bajo = estado.get(producto_id, (None, False))
+        if cantidad > 0:
+            posibles = max(stock, 0) // cantidad
+            unidades = posibles if unidades is None else min(unidades, posibles)
+        estado[producto_id] = (unidades, bajo or stock <= minimo or stock <= 0)
+
+    productos = []
+    for producto_id, (unidades, bajo) in estado.items():
+        unidades = int(unidades or 0)
+        productos.append(Producto(
+            id=producto_id,
+            unidades_disponibles=unidades,
+            disponible_por_stock=not bajo and unidades > 0,
+        ))
+    Producto.objects.bulk_update(productos, ['unidades_disponibles', 'disponible_por_stock'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0005_carritoitem'),
+        ('inventario', '0003_remove_ingrediente_costo_unitario_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='disponible_por_stock',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='unidades_disponibles',
+            field=models.IntegerField(default=9999),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['disponible', 'disponible_por_stock', 'categoria'], name='producto_menu_idx'),
+        ),
+        migrations.RunPython(calcular_disponibilidad, migrations.RunPython.noop),
+    ]
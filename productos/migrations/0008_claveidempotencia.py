@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0007_reservastock'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaveIdempotencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=255)),
+                ('huella', models.CharField(max_length=64)),
+                ('codigo', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('respuesta', models.TextField(blank=True, default='')),
+                ('expira_en', models.DateTimeField(db_index=True)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('usuario', 'clave')},
+            },
+        ),
+    ]
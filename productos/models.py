@@ -1,4 +1,17 @@
 from django.db import models
+from django.db.models import Case, Count, F, Min, Q, Value, When
+from django.db.models.functions import Coalesce, Floor, Greatest
+
+# Productos sin receta (ej. una Coca-Cola) no dependen de ingredientes
+STOCK_SIN_RECETA = 9999
+
+_DECIMAL = models.DecimalField(max_digits=10, decimal_places=2)
+
+# Ingrediente en estado 'bajo' o 'agotado' (ver Ingrediente.estado_stock)
+_INGREDIENTE_BAJO = Q(materiales__ingrediente__stock_actual__lte=F('materiales__ingrediente__stock_minimo')) | Q(
+    materiales__ingrediente__stock_actual__lte=0
+)
+
 
 class Categoria(models.Model):
     nombre = models.CharField(max_length=100, unique=True)
@@ -8,6 +21,57 @@ class Categoria(models.Model):
     def __str__(self):
         return self.nombre
 
+class ProductoQuerySet(models.QuerySet):
+
+    def con_disponibilidad(self, consumo=None):
+        """
+        Anota en SQL (una sola consulta agrupada, sin importar el tamaño de
+        las recetas) sobre la lista de materiales compilada, así los combos
+        cuentan con los ingredientes de sus productos:
+
+        - ``lineas_receta``: cuántos ingredientes tiene la receta.
+        - ``unidades_construibles``: MIN(FLOOR(stock / cantidad)); 9999 si no
+          tiene receta. ``consumo`` = {ingrediente_id: cantidad} se descuenta
+          del stock antes de dividir (ej. lo que ya está en la bolsa).
+        - ``ingredientes_bajos``: ingredientes en estado 'bajo' o 'agotado'.
+        - ``disponible_ahora``: lo mismo que ``is_currently_available``.
+        """
+        stock = F('materiales__ingrediente__stock_actual')
+        if consumo:
+            stock = stock - Case(
+                *[
+                    When(materiales__ingrediente_id=ing_id, then=Value(cantidad))
+                    for ing_id, cantidad in consumo.items()
+                ],
+                default=Value(0),
+                output_field=_DECIMAL,
+            )
+        stock = Greatest(stock, Value(0), output_field=_DECIMAL)
+
+        return self.annotate(
+            lineas_receta=Count('materiales'),
+            ingredientes_bajos=Count('materiales', filter=_INGREDIENTE_BAJO),
+            _unidades_receta=Min(
+                Case(
+                    When(materiales__cantidad__gt=0, then=Floor(stock / F('materiales__cantidad'))),
+                    default=None,
+                    output_field=_DECIMAL,
+                )
+            ),
+        ).annotate(
+            unidades_construibles=Case(
+                When(lineas_receta=0, then=Value(STOCK_SIN_RECETA)),
+                default=Coalesce(F('_unidades_receta'), Value(0), output_field=_DECIMAL),
+                output_field=models.IntegerField(),
+            ),
+            disponible_ahora=Case(
+                When(Q(disponible=True, ingredientes_bajos=0), then=Value(True)),
+                default=Value(False),
+                output_field=models.BooleanField(),
+            ),
+        )
+
+
 class Producto(models.Model):
     nombre = models.CharField(max_length=100)
     descripcion = models.TextField(blank=True, null=True)
@@ -16,17 +80,31 @@ class Producto(models.Model):
     imagen_url = models.URLField(blank=True, null=True)  
     categoria = models.ForeignKey(Categoria, on_delete=models.SET_NULL, null=True)
     disponible = models.BooleanField(default=True)
+
+    # Disponibilidad desnormalizada: se mantiene en la misma transacción que
+    # cambia el stock o la receta (productos/signals.py). Los valores por
+    # defecto corresponden a un producto sin receta.
+    unidades_disponibles = models.IntegerField(default=STOCK_SIN_RECETA)
+    disponible_por_stock = models.BooleanField(default=True)
+
     creado_en = models.DateTimeField(auto_now_add=True)
     actualizado_en = models.DateTimeField(auto_now=True)
 
+    objects = ProductoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['disponible', 'disponible_por_stock', 'categoria'], name='producto_menu_idx'),
+        ]
+
     def __str__(self):
         return self.nombre
     
     def calcular_costo_produccion(self):
-        """Calcula el costo automáticamente basado en los ingredientes"""
+        """Calcula el costo automáticamente basado en los ingredientes (combos incluidos)"""
         total = 0
-        for receta in self.receta_set.all():
-            total += receta.cantidad * receta.ingrediente.costo_unitario
+        for material in self.materiales.select_related('ingrediente'):
+            total += material.cantidad * material.ingrediente.costo_unitario
         return total
     
     @property
@@ -39,19 +117,24 @@ class Producto(models.Model):
         # 1. Chequeo del estado manual del administrador
         if not self.disponible:
             return False
-            
-        # 2. Chequeo de stock basado en la receta
-        # (Usamos prefetch_related en la VISTA para optimizar esto)
-        recetas = self.receta_set.all().select_related('ingrediente')
 
-        # Si no tiene receta (ej. una Coca-Cola), está disponible.
-        if not recetas.exists():
-            return True
+        # 2. Ya calculado en SQL con Producto.objects.con_disponibilidad()
+        if hasattr(self, 'disponible_ahora'):
+            return self.disponible_ahora
+
+        # 3. Sin prefetch: una sola consulta buscando algún ingrediente bajo.
+        #    Si no tiene receta (ej. una Coca-Cola), está disponible.
+        if 'materiales' not in getattr(self, '_prefetched_objects_cache', {}):
+            bajo = Q(ingrediente__stock_actual__lte=F('ingrediente__stock_minimo')) | Q(
+                ingrediente__stock_actual__lte=0
+            )
+            return not self.materiales.filter(bajo).exists()
 
-        for receta in recetas:
+        # 4. Con prefetch_related('materiales__ingrediente') en la vista: sin consultas
+        for material in self.materiales.all():
             # Obtenemos el estado ('normal', 'bajo', 'agotado') del ingrediente
             # Asumimos que tu modelo Ingrediente tiene la propiedad @property estado_stock
-            ingrediente_status = receta.ingrediente.estado_stock
+            ingrediente_status = material.ingrediente.estado_stock
 
             # Si CUALQUIER ingrediente está 'bajo' o 'agotado',
             # el producto completo NO está disponible.
@@ -89,3 +172,74 @@ class CarritoItem(models.Model):
 
     def __str__(self):
         return f"{self.cantidad}x {self.producto.nombre} ({self.usuario.email})"
+
+
+class ReservaStock(models.Model):
+    """
+    Retención temporal del stock de un producto mientras está en la bolsa.
+    Vence en ``expira_en``; las vistas del carrito la crean y la extienden.
+    """
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE)
+    cantidad = models.PositiveIntegerField()
+    expira_en = models.DateTimeField(db_index=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['usuario', 'producto']
+
+    def __str__(self):
+        return f"Reserva {self.cantidad}x {self.producto.nombre} hasta {self.expira_en:%H:%M}"
+
+
+class ClaveIdempotencia(models.Model):
+    """
+    Respuesta guardada de un POST con cabecera ``Idempotency-Key`` (ver
+    productos/idempotencia.py). Mientras ``respuesta`` está vacía la
+    solicitud original sigue en curso.
+    """
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    clave = models.CharField(max_length=255)
+    huella = models.CharField(max_length=64)   # sha256 del cuerpo
+    codigo = models.PositiveSmallIntegerField(null=True, blank=True)
+    respuesta = models.TextField(blank=True, default='')
+    expira_en = models.DateTimeField(db_index=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['usuario', 'clave']
+
+    @property
+    def completa(self):
+        return self.codigo is not None
+
+    def __str__(self):
+        return f"{self.clave} ({self.usuario_id})"
+
+
+class Contador(models.Model):
+    """
+    Versiones compartidas entre workers (catálogo, índice de recetas, bolsa
+    de cada usuario...). Se suben con un UPDATE atómico: dos procesos nunca
+    reciben el mismo número (ver productos/versiones.py).
+    """
+    clave = models.CharField(max_length=100, primary_key=True)
+    valor = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.clave} = {self.valor}"
+
+
+class CambioInventario(models.Model):
+    """
+    Registro de cambios del inventario: el id es la versión. ``productos``
+    son los que pudieron cambiar de disponibilidad; ``completo`` marca una
+    invalidación total (receta, producto) después de la cual hay que
+    recalcular todo. Se conservan los últimos (ver productos/stock.py).
+    """
+    productos = models.JSONField(default=list, blank=True)
+    completo = models.BooleanField(default=False)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"v{self.id}: {'completo' if self.completo else self.productos}"
@@ -0,0 +1,90 @@
+# productos/signals.py
+"""
+Mantenimiento de la disponibilidad de productos.
+
+1. Columnas materializadas de Producto (``unidades_disponibles`` y
+   ``disponible_por_stock``) y lista de materiales (MaterialProducto): se
+   recalculan DENTRO de la transacción que cambia el stock de un ingrediente,
+   una receta o un combo, así nunca quedan desfasadas de lo confirmado.
+
+   - Cambio de stock de un ingrediente → sólo se refrescan los productos que
+     lo usan (índice inverso).
+   - Cambio de receta o combo → se recompila ese producto y los combos que
+     lo contienen, y se refresca su disponibilidad.
+   - Borrado de un producto → se recompilan los combos que lo incluían, una
+     vez borradas en cascada sus filas de ComponenteCombo.
+
+2. Caché de stock: cualquier cambio en ingredientes, recetas o productos sube
+   la versión del inventario (ver ``productos.stock``). La subida se hace al
+   confirmar la transacción para que ningún worker guarde en caché datos aún
+   no confirmados. Una transacción que toca muchas filas (importar un menú,
+   borrar un ingrediente en cascada) invalida índice y mapa UNA sola vez.
+   Un cambio en la bolsa de un usuario sólo sube la versión de SU bolsa.
+
+3. Catálogo: productos y categorías suben la versión del catálogo, que junto
+   con la del inventario es la llave del caché de fragmentos del menú.
+"""
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from inventario.models import ComponenteCombo, Ingrediente, Receta
+from .models import Categoria, Producto, CarritoItem
+from .versiones import al_confirmar_una_vez
+from .stock import (
+    invalidar_recetas, invalidar_carrito, invalidar_catalogo,
+    recompilar_productos, stock_ingredientes_cambiado,
+)
+
+
+@receiver(post_save, sender=Ingrediente)
+def ingrediente_guardado(sender, instance, **kwargs):
+    stock_ingredientes_cambiado([instance.pk])
+
+
+@receiver(post_save, sender=Receta)
+@receiver(post_delete, sender=Receta)
+@receiver(post_save, sender=ComponenteCombo)
+@receiver(post_delete, sender=ComponenteCombo)
+def receta_guardada(sender, instance, **kwargs):
+    # Borrado en cascada de un producto: lo resuelve producto_borrado
+    origen = kwargs.get('origin')
+    if not (isinstance(origen, Producto) or getattr(origen, 'model', None) is Producto):
+        recompilar_productos([instance.combo_id if sender is ComponenteCombo else instance.producto_id])
+    al_confirmar_una_vez(invalidar_recetas)
+
+
+@receiver(pre_delete, sender=Producto)
+def producto_borrandose(sender, instance, **kwargs):
+    # Todavía existen sus filas de ComponenteCombo: se anotan los combos
+    instance._combos_afectados = list(
+        ComponenteCombo.objects.filter(producto=instance).values_list('combo_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Producto)
+def producto_borrado(sender, instance, **kwargs):
+    # Mismo atomic que el borrado, con la cascada ya hecha
+    combos = getattr(instance, '_combos_afectados', None)
+    if combos:
+        recompilar_productos(combos)
+
+
+@receiver(post_delete, sender=Ingrediente)
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+def receta_cambiada(sender, **kwargs):
+    al_confirmar_una_vez(invalidar_recetas)
+
+
+@receiver(post_save, sender=CarritoItem)
+@receiver(post_delete, sender=CarritoItem)
+def carrito_cambiado(sender, instance, **kwargs):
+    al_confirmar_una_vez(invalidar_carrito, instance.usuario_id)
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def catalogo_cambiado(sender, **kwargs):
+    al_confirmar_una_vez(invalidar_catalogo)
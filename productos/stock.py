@@ -0,0 +1,829 @@
+# productos/stock.py
+"""
+Servicio único de disponibilidad de stock.
+
+Todas las vistas que necesitan saber "cuántas unidades de un producto se
+pueden preparar" pasan por aquí, en lugar de recorrer las recetas producto
+por producto en Python.
+"""
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError, transaction
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+
+from inventario.models import ComponenteCombo, ConsumoPendiente, Ingrediente, MaterialProducto, Receta
+from .models import CambioInventario, Contador, Producto, CarritoItem, ReservaStock
+from .versiones import al_confirmar_juntos, registrar_evento, subir_version, ultimo_evento, version
+
+# Caché compartida entre workers: el mapa se guarda bajo la versión actual
+# del inventario (el último id de CambioInventario); cada cambio registra
+# una versión nueva y deja el mapa viejo huérfano (expira solo).
+STOCK_MAP_KEY = 'inventario:stock:v{version}'
+STOCK_MAP_ULTIMO_KEY = 'inventario:stock:ultimo'
+STOCK_MAP_TIMEOUT = 60 * 10
+
+# Índice inverso ingrediente → (producto, cantidad); cambia sólo con las recetas
+INDICE_VERSION_KEY = 'inventario:indice:version'
+INDICE_KEY = 'inventario:indice:v{version}'
+INDICE_TIMEOUT = 60 * 60 * 24
+# Lista de materiales compilada producto → {ingrediente: cantidad}; misma versión
+MATERIALES_KEY = 'inventario:materiales:v{version}'
+
+# Deltas de "cambios desde" hasta esta distancia; el registro guarda más
+MAX_VERSIONES_DELTA = 200
+CAMBIOS_CONSERVADOS = 1000
+
+# Versión de la bolsa de cada usuario (las reservas también cambian su stock)
+CARRITO_VERSION_KEY = 'carrito:version:{usuario_id}'
+
+# Versión del catálogo (nombres, precios, imágenes, categorías): llave del
+# caché de fragmentos del menú junto con la de recetas
+CATALOGO_VERSION_KEY = 'catalogo:version'
+
+# Cuánto dura la reserva de stock de un producto en la bolsa
+RESERVA_MINUTOS = getattr(settings, 'RESERVA_CARRITO_MINUTOS', 15)
+
+# Checkout sólo agrega al libro ConsumoPendiente; compactar_stock lo aplica
+STOCK_DIFERIDO = getattr(settings, 'INVENTARIO_STOCK_DIFERIDO', False)
+
+
+def stock_por_producto(producto_ids=None, consumo=None):
+    """
+    Devuelve {producto_id: unidades construibles} en UNA consulta.
+
+    - ``producto_ids=None`` → todos los productos marcados como disponibles.
+    - Sin ``consumo`` se lee la columna materializada ``unidades_disponibles``.
+    - ``consumo`` → stock por ingrediente que se descuenta antes de dividir
+      (por ejemplo, lo que el usuario ya tiene en su bolsa); se calcula
+      MIN(FLOOR(stock_actual / cantidad)) agrupado en SQL.
+    """
+    if producto_ids is None:
+        productos = Producto.objects.filter(disponible=True)
+    else:
+        productos = Producto.objects.filter(id__in=producto_ids)
+
+    consumo = sumar_consumos(consumo, consumo_pendiente())
+    if not consumo:
+        return dict(productos.order_by().values_list('id', 'unidades_disponibles'))
+
+    filas = (
+        productos.order_by().values('id')
+        .con_disponibilidad(consumo)
+        .values_list('id', 'unidades_construibles')
+    )
+    return dict(filas)
+
+
+# ==============================================
+#  COLUMNAS MATERIALIZADAS EN PRODUCTO
+# ==============================================
+
+def refrescar_disponibilidad(productos):
+    """
+    Recalcula ``unidades_disponibles`` y ``disponible_por_stock`` de los
+    productos dados (queryset de Producto) dentro de la transacción actual.
+
+    Primero bloquea las filas en orden de id: si dos transacciones tocan
+    ingredientes distintos del mismo producto, la segunda espera y recalcula
+    viendo ya lo confirmado por la primera. El bloqueo es FOR NO KEY UPDATE:
+    no choca con el KEY SHARE que PostgreSQL toma sobre Producto al validar
+    las FK de DetallePedido o CarritoItem de otra transacción, así un
+    checkout que refresca no se cruza con otro que confirma sus detalles.
+    """
+    with transaction.atomic(savepoint=False):
+        ids = list(
+            productos.order_by('id').select_for_update(no_key=True).values_list('id', flat=True)
+        )
+        if not ids:
+            return 0
+
+        filas = (
+            Producto.objects.filter(id__in=ids).order_by().values('id')
+            .con_disponibilidad(consumo_pendiente())
+            .values_list('id', 'unidades_construibles', 'ingredientes_bajos')
+        )
+        cambios = [
+            Producto(
+                id=producto_id,
+                unidades_disponibles=unidades,
+                disponible_por_stock=not bajos and unidades > 0,
+            )
+            for producto_id, unidades, bajos in filas
+        ]
+        return Producto.objects.bulk_update(cambios, ['unidades_disponibles', 'disponible_por_stock'])
+
+
+def refrescar_por_ingredientes(ingrediente_ids):
+    """Refresca sólo los productos cuya receta usa alguno de estos ingredientes."""
+    return refrescar_disponibilidad(
+        Producto.objects.filter(
+            id__in=MaterialProducto.objects.filter(ingrediente_id__in=ingrediente_ids).values('producto_id')
+        )
+    )
+
+
+def stock_ingredientes_cambiado(ingrediente_ids):
+    """
+    Lo mismo que hace la señal de ``Ingrediente.save()``, para escrituras que
+    no disparan señales (``bulk_update``, ``QuerySet.update``): refresca las
+    columnas materializadas ya y publica el nuevo mapa al confirmar.
+    """
+    ingrediente_ids = list(ingrediente_ids)
+    if not ingrediente_ids:
+        return
+    refrescar_por_ingredientes(ingrediente_ids)
+    al_confirmar_juntos(actualizar_stock_ingredientes, ingrediente_ids)
+
+
+def descontar_ingredientes(requerido, retenido=None):
+    """
+    Descuenta ``requerido`` = {ingrediente_id: cantidad} sin leer antes el
+    stock. Cada ingrediente es una sola sentencia que valida y descuenta:
+
+        UPDATE ... SET stock_actual = stock_actual - X
+        WHERE id = ? AND stock_actual >= X + retenido
+
+    así el bloqueo de la fila dura lo que dura el UPDATE dentro de la
+    transacción, no una lectura + cálculo en Python + escritura. Se recorre en
+    orden de id para que dos descuentos simultáneos nunca se crucen.
+
+    Si algún ingrediente no alcanza lanza ``ValueError`` con el detalle (la
+    transacción del llamador deshace lo ya descontado). La restricción
+    ``ingrediente_stock_no_negativo`` queda como red de seguridad.
+
+    Devuelve {ingrediente_id: stock final}, leído al terminar con las filas
+    ya bloqueadas por los UPDATE: es exacto aunque otro checkout descuente lo
+    mismo en paralelo (sirve para los saldos de MovimientoInventario). Las
+    señales de ``Ingrediente`` quedan a cargo del llamador
+    (``stock_ingredientes_cambiado``).
+    """
+    retenido = retenido or {}
+    ahora = timezone.now()
+    for ing_id in sorted(requerido):
+        cantidad = requerido[ing_id]
+        descontado = Ingrediente.objects.filter(
+            id=ing_id, stock_actual__gte=cantidad + retenido.get(ing_id, 0),
+        ).update(stock_actual=F('stock_actual') - cantidad, actualizado_en=ahora)
+        if not descontado:
+            nombre, stock = Ingrediente.objects.filter(id=ing_id).values_list('nombre', 'stock_actual').get()
+            raise _sin_stock(nombre, cantidad, stock - retenido.get(ing_id, 0))
+    return dict(Ingrediente.objects.filter(id__in=requerido).values_list('id', 'stock_actual'))
+
+
+def _sin_stock(nombre, cantidad, libre):
+    return ValueError(
+        f'Sin stock suficiente del ingrediente "{nombre}": '
+        f'se necesitan {cantidad}, quedan {max(libre, 0)}'
+    )
+
+
+# ==============================================
+#  LIBRO DE CONSUMOS (INVENTARIO_STOCK_DIFERIDO)
+# ==============================================
+#
+# En hora pico todos los pedidos descuentan las mismas filas (pan, carne,
+# queso). En modo diferido el checkout sólo INSERTA en ConsumoPendiente y
+# ``compactar_consumos`` (comando compactar_stock, cada pocos segundos)
+# suma los consumos a ``stock_actual`` por lotes.
+#
+# Stock real = stock_actual - consumos pendientes; stock_por_producto y las
+# columnas materializadas ya lo descuentan. La validación del checkout es
+# optimista (lee sin bloquear): con mucha concurrencia se puede vender de más.
+# La compactación nunca lo esconde: un ingrediente cuyo pendiente supera su
+# stock_actual no se toca, sus consumos quedan en el libro (el stock real
+# sigue negativo y los productos agotados) y se informa como sobrevendido.
+
+def sumar_consumos(*consumos):
+    """Suma varios {ingrediente_id: cantidad} (los vacíos o None se ignoran)."""
+    total = {}
+    for consumo in consumos:
+        for ing_id, cantidad in (consumo or {}).items():
+            total[ing_id] = total.get(ing_id, 0) + cantidad
+    return total
+
+
+def consumo_pendiente(ingrediente_ids=None):
+    """{ingrediente_id: cantidad} aún no aplicado a stock_actual."""
+    if not STOCK_DIFERIDO:
+        return {}
+    pendientes = ConsumoPendiente.objects.all()
+    if ingrediente_ids is not None:
+        pendientes = pendientes.filter(ingrediente_id__in=ingrediente_ids)
+    return dict(
+        pendientes.order_by().values('ingrediente_id')
+        .annotate(total=Sum('cantidad'))
+        .values_list('ingrediente_id', 'total')
+    )
+
+
+def registrar_consumo(requerido, retenido=None):
+    """
+    Alternativa a ``descontar_ingredientes`` en modo diferido: valida contra
+    el stock real sin bloquear filas e inserta los consumos en el libro.
+    Devuelve {ingrediente_id: stock real después del consumo}.
+    """
+    retenido = retenido or {}
+    pendiente = consumo_pendiente(requerido)
+    saldo = {}
+    for ing_id, nombre, stock in (
+        Ingrediente.objects.filter(id__in=requerido).order_by('id').values_list('id', 'nombre', 'stock_actual')
+    ):
+        libre = stock - pendiente.get(ing_id, 0)
+        if libre - retenido.get(ing_id, 0) < requerido[ing_id]:
+            raise _sin_stock(nombre, requerido[ing_id], libre - retenido.get(ing_id, 0))
+        saldo[ing_id] = libre - requerido[ing_id]
+
+    ConsumoPendiente.objects.bulk_create([
+        ConsumoPendiente(ingrediente_id=ing_id, cantidad=cantidad)
+        for ing_id, cantidad in requerido.items()
+    ])
+    # Sólo se publica el mapa: las columnas materializadas las pone al día
+    # la compactación (refrescarlas aquí volvería a bloquear filas calientes)
+    al_confirmar_juntos(actualizar_stock_ingredientes, requerido)
+    return saldo
+
+
+def compactar_consumos(ingrediente_ids=None):
+    """
+    Aplica los consumos pendientes a ``stock_actual``: por ingrediente, la
+    suma de sus filas hasta el último id visto al empezar, en un UPDATE
+    condicional (``stock_actual >= suma``) y un DELETE de esas filas, en una
+    transacción. Un consumo insertado a mitad de la compactación queda para
+    la próxima.
+
+    Si un ingrediente se vendió de más su UPDATE no aplica y sus consumos
+    siguen pendientes hasta que se reponga: nunca se recorta a 0.
+
+    Devuelve (consumos aplicados, [(nombre, stock_actual, pendiente)] de los
+    ingredientes sobrevendidos).
+    """
+    pendientes = ConsumoPendiente.objects.all()
+    if ingrediente_ids is not None:
+        pendientes = pendientes.filter(ingrediente_id__in=ingrediente_ids)
+
+    with transaction.atomic():
+        tope = pendientes.aggregate(tope=Max('id'))['tope']
+        if tope is None:
+            return 0, []
+        pendientes = pendientes.filter(id__lte=tope)
+        sumas = dict(
+            pendientes.order_by().values('ingrediente_id')
+            .annotate(total=Sum('cantidad'))
+            .values_list('ingrediente_id', 'total')
+        )
+
+        ahora = timezone.now()
+        aplicados, sobrevendidos = [], []
+        for ing_id in sorted(sumas):
+            if Ingrediente.objects.filter(id=ing_id, stock_actual__gte=sumas[ing_id]).update(
+                stock_actual=F('stock_actual') - sumas[ing_id], actualizado_en=ahora,
+            ):
+                aplicados.append(ing_id)
+            else:
+                nombre, stock = Ingrediente.objects.filter(id=ing_id).values_list('nombre', 'stock_actual').get()
+                sobrevendidos.append((nombre, stock, sumas[ing_id]))
+
+        borrados = 0
+        if aplicados:
+            borrados, _ = pendientes.filter(ingrediente_id__in=aplicados).delete()
+            stock_ingredientes_cambiado(aplicados)
+    return borrados, sobrevendidos
+
+
+# ==============================================
+#  VERSIÓN DE INVENTARIO + CACHÉ DEL MAPA
+# ==============================================
+
+def version_inventario():
+    """Versión global del inventario: id del último CambioInventario."""
+    return ultimo_evento(CambioInventario)
+
+
+def invalidar_stock():
+    """Registra una invalidación total; las lecturas siguientes recalculan el mapa."""
+    return registrar_evento(CambioInventario, CAMBIOS_CONSERVADOS, completo=True).id
+
+
+def invalidar_recetas():
+    """Cambió una receta o un producto: se reconstruyen índice y mapa completos."""
+    subir_version(INDICE_VERSION_KEY)
+    return invalidar_stock()
+
+
+def version_recetas():
+    """Versión de recetas, combos y productos (la del índice y la lista de materiales)."""
+    return version(INDICE_VERSION_KEY)
+
+
+def version_catalogo():
+    return version(CATALOGO_VERSION_KEY)
+
+
+def invalidar_catalogo():
+    return subir_version(CATALOGO_VERSION_KEY)
+
+
+def stock_por_producto_cache(version_actual=None):
+    """
+    Igual que ``stock_por_producto()`` (todos los productos disponibles), pero
+    servido desde la caché mientras la versión del inventario no cambie.
+
+    Si falta el mapa de esta versión se parte del último mapa armado y se
+    recalculan sólo los productos que el registro de cambios dice que
+    pudieron cambiar desde entonces. Sin registro completo (invalidación
+    total, eventos podados) se recalcula todo.
+    """
+    if version_actual is None:
+        version_actual = version_inventario()
+    key = STOCK_MAP_KEY.format(version=version_actual)
+    stock = cache.get(key)
+    if stock is not None:
+        return stock
+
+    ultimo = cache.get(STOCK_MAP_ULTIMO_KEY)
+    cambios = None
+    if ultimo is not None and ultimo[0] <= version_actual:
+        cambios = cambios_desde(ultimo[0], version_actual)
+
+    if cambios is None:
+        stock = stock_por_producto(consumo=consumo_reservas())
+    else:
+        stock = dict(ultimo[1])
+        if cambios:
+            stock.update(stock_por_producto(cambios & stock.keys(), consumo=consumo_reservas()))
+
+    cache.set(key, stock, STOCK_MAP_TIMEOUT)
+    if ultimo is None or version_actual > ultimo[0]:
+        cache.set(STOCK_MAP_ULTIMO_KEY, (version_actual, stock), STOCK_MAP_TIMEOUT)
+    return stock
+
+
+# ==============================================
+#  LISTA DE MATERIALES COMPILADA (combos incluidos)
+# ==============================================
+#
+# Receta dice qué ingredientes lleva un producto; ComponenteCombo, qué
+# productos lleva un combo. MaterialProducto guarda el resultado ya aplanado
+# (ingrediente → cantidad por unidad) para que SQL y Python no tengan que
+# recorrer combos: disponibilidad, consumo de la bolsa, checkout y costos
+# leen sólo esta tabla o su copia en caché.
+
+def _aplanar(recetas, componentes):
+    """Devuelve una función producto_id → {ingrediente_id: cantidad}, memorizada."""
+    planos = {}
+
+    def aplanar(producto_id, camino=()):
+        if producto_id in planos:
+            return planos[producto_id]
+        if producto_id in camino:
+            # Ciclo de combos (ComponenteCombo.clean lo impide): se corta aquí
+            return {}
+        vector = dict(recetas.get(producto_id, {}))
+        for componente_id, unidades in componentes.get(producto_id, ()):
+            for ing_id, cantidad in aplanar(componente_id, camino + (producto_id,)).items():
+                vector[ing_id] = vector.get(ing_id, 0) + cantidad * unidades
+        planos[producto_id] = vector
+        return vector
+
+    return aplanar
+
+
+def _combos_que_contienen(producto_ids):
+    """Los productos y, hacia arriba, cada combo que incluya alguno (una consulta por nivel)."""
+    objetivo, nivel = set(), set(producto_ids)
+    while nivel:
+        objetivo |= nivel
+        nivel = set(
+            ComponenteCombo.objects.filter(producto_id__in=nivel).values_list('combo_id', flat=True)
+        ) - objetivo
+    return objetivo
+
+
+def _cargar_recetas(producto_ids=None):
+    """
+    (recetas, componentes) de estos productos y, hacia abajo, de todo lo que
+    contienen sus combos: lo justo para aplanarlos (``None`` = todos).
+    """
+    componentes = {}
+    filas = ComponenteCombo.objects.values_list('combo_id', 'producto_id', 'cantidad')
+    if producto_ids is None:
+        for combo_id, producto_id, unidades in filas:
+            componentes.setdefault(combo_id, []).append((producto_id, unidades))
+        filas_receta = Receta.objects.all()
+    else:
+        vistos, nivel = set(), set(producto_ids)
+        while nivel:
+            vistos |= nivel
+            siguiente = set()
+            for combo_id, producto_id, unidades in filas.filter(combo_id__in=nivel):
+                componentes.setdefault(combo_id, []).append((producto_id, unidades))
+                siguiente.add(producto_id)
+            nivel = siguiente - vistos
+        filas_receta = Receta.objects.filter(producto_id__in=vistos)
+
+    recetas = {}
+    for producto_id, ing_id, cantidad in filas_receta.values_list('producto_id', 'ingrediente_id', 'cantidad'):
+        recetas.setdefault(producto_id, {})[ing_id] = cantidad
+    return recetas, componentes
+
+
+def compilar_materiales(producto_ids=None):
+    """
+    Regenera MaterialProducto de estos productos y de todos los combos que
+    los contienen (``None`` = todos). Sólo se leen las recetas y combos de
+    esos productos y de sus componentes, no las tablas enteras. Devuelve el
+    conjunto de productos recompilados, para refrescar su disponibilidad.
+    """
+    if producto_ids is None:
+        objetivo = set(Producto.objects.values_list('id', flat=True))
+        recetas, componentes = _cargar_recetas()
+    else:
+        objetivo = _combos_que_contienen(producto_ids)
+        recetas, componentes = _cargar_recetas(objetivo)
+
+    aplanar = _aplanar(recetas, componentes)
+    with transaction.atomic(savepoint=False):
+        if producto_ids is None:
+            MaterialProducto.objects.all().delete()
+        else:
+            MaterialProducto.objects.filter(producto_id__in=objetivo).delete()
+        MaterialProducto.objects.bulk_create([
+            MaterialProducto(producto_id=producto_id, ingrediente_id=ing_id, cantidad=cantidad)
+            for producto_id in sorted(objetivo)
+            for ing_id, cantidad in sorted(aplanar(producto_id).items())
+            if cantidad > 0
+        ])
+    return objetivo
+
+
+def recompilar_productos(producto_ids=None):
+    """Recompila la lista de materiales y refresca la disponibilidad afectada."""
+    afectados = compilar_materiales(producto_ids)
+    refrescar_disponibilidad(Producto.objects.filter(id__in=afectados))
+    return afectados
+
+
+def lista_materiales():
+    """
+    {producto_id: {ingrediente_id: cantidad}} de todos los productos, en
+    caché hasta que cambie alguna receta, combo o producto.
+    """
+    key = MATERIALES_KEY.format(version=version(INDICE_VERSION_KEY))
+    materiales = cache.get(key)
+    if materiales is None:
+        materiales = {}
+        for producto_id, ing_id, cantidad in MaterialProducto.objects.values_list(
+            'producto_id', 'ingrediente_id', 'cantidad'
+        ):
+            materiales.setdefault(producto_id, {})[ing_id] = cantidad
+        cache.set(key, materiales, INDICE_TIMEOUT)
+    return materiales
+
+
+def consumo_de(unidades):
+    """
+    {producto_id: unidades} → {ingrediente_id: cantidad}: suma de los
+    vectores de la lista de materiales, sin consultas si está en caché.
+    """
+    materiales = lista_materiales()
+    total = {}
+    for producto_id, cantidad_producto in unidades.items():
+        for ing_id, cantidad in materiales.get(producto_id, {}).items():
+            total[ing_id] = total.get(ing_id, 0) + cantidad * cantidad_producto
+    return total
+
+
+def ingredientes_de(producto_ids):
+    """Ingredientes que usan estos productos (según la lista compilada)."""
+    materiales = lista_materiales()
+    return {ing_id for producto_id in producto_ids for ing_id in materiales.get(producto_id, {})}
+
+
+def _unidades_por_producto(filas):
+    """{producto_id: SUM(cantidad)} de un queryset de CarritoItem o ReservaStock."""
+    return dict(
+        filas.order_by().values('producto_id')
+        .annotate(total=Sum('cantidad'))
+        .values_list('producto_id', 'total')
+    )
+
+
+# ==============================================
+#  ÍNDICE INVERSO INGREDIENTE → PRODUCTOS
+# ==============================================
+
+def indice_ingredientes():
+    """
+    {ingrediente_id: [(producto_id, cantidad), ...]} de los productos
+    disponibles. Se guarda en caché hasta que cambie alguna receta o producto.
+    """
+    key = INDICE_KEY.format(version=version(INDICE_VERSION_KEY))
+    indice = cache.get(key)
+    if indice is None:
+        indice = {}
+        filas = MaterialProducto.objects.filter(producto__disponible=True).values_list(
+            'ingrediente_id', 'producto_id', 'cantidad'
+        )
+        for ingrediente_id, producto_id, cantidad in filas:
+            indice.setdefault(ingrediente_id, []).append((producto_id, cantidad))
+        cache.set(key, indice, INDICE_TIMEOUT)
+    return indice
+
+
+def productos_afectados(ingrediente_ids):
+    """Productos cuya disponibilidad depende de alguno de estos ingredientes."""
+    indice = indice_ingredientes()
+    return {
+        producto_id
+        for ingrediente_id in ingrediente_ids
+        for producto_id, _cantidad in indice.get(ingrediente_id, ())
+    }
+
+
+def actualizar_stock_ingredientes(ingrediente_ids):
+    """
+    Registra una versión nueva del inventario con los productos que usan
+    estos ingredientes. El mapa no se toca aquí: la siguiente lectura
+    (``stock_por_producto_cache``) recalcula sólo esos productos.
+    """
+    afectados = productos_afectados(ingrediente_ids)
+    return registrar_evento(CambioInventario, CAMBIOS_CONSERVADOS, productos=sorted(afectados)).id
+
+
+def cambios_desde(desde, hasta=None):
+    """
+    Productos que pudieron cambiar de disponibilidad después de la versión
+    ``desde`` (hasta ``hasta``, por defecto la actual). Devuelve None si no se
+    puede saber (hubo una invalidación completa, la versión es demasiado
+    vieja o falta algún evento intermedio): hay que mandar todo.
+    """
+    if hasta is None:
+        hasta = version_inventario()
+    if desde > hasta or hasta - desde > MAX_VERSIONES_DELTA:
+        return None
+    if desde == hasta:
+        return set()
+
+    eventos = list(
+        CambioInventario.objects.filter(id__gt=desde, id__lte=hasta).values_list('productos', 'completo')
+    )
+    # Los ids son consecutivos: un id sin fila (evento podado) puede ser un
+    # cambio perdido y es mejor el mapa completo que un delta incompleto
+    if len(eventos) != hasta - desde:
+        return None
+
+    cambios = set()
+    for productos, completo in eventos:
+        if completo:
+            return None
+        cambios.update(productos)
+    return cambios
+
+
+# ==============================================
+#  VERSIÓN DE LA BOLSA (por usuario)
+# ==============================================
+
+def version_carrito(usuario):
+    if usuario is None or not usuario.is_authenticated:
+        return 0
+    return version(CARRITO_VERSION_KEY.format(usuario_id=usuario.pk))
+
+
+def invalidar_carrito(usuario_id):
+    return subir_version(CARRITO_VERSION_KEY.format(usuario_id=usuario_id))
+
+
+def token_stock(usuario=None):
+    """
+    Identifica el stock que ve un usuario: "<versión inventario>.<versión bolsa>".
+    Sirve como ETag y como valor de ``?since=`` en la API.
+    """
+    return f'{version_inventario()}.{version_carrito(usuario)}'
+
+
+def consumo_carrito(usuario):
+    """
+    Consumo total por ingrediente de la bolsa del usuario
+    ({ingrediente_id: cantidad}): una consulta por las cantidades y la suma de
+    vectores de la lista de materiales en memoria.
+    """
+    if usuario is None or not usuario.is_authenticated:
+        return {}
+
+    return consumo_de(_unidades_por_producto(CarritoItem.objects.filter(usuario=usuario)))
+
+
+def stock_para_usuario(producto_ids=None, usuario=None):
+    """
+    Stock que todavía se puede agregar: construible menos TODAS las reservas
+    vigentes (la bolsa del propio usuario también está reservada).
+    """
+    if producto_ids is None:
+        return stock_por_producto_cache()
+    return stock_por_producto(producto_ids, consumo=consumo_reservas())
+
+
+# ==============================================
+#  RESERVAS DE STOCK CON VENCIMIENTO
+# ==============================================
+
+def consumo_reservas(excluir_usuario=None):
+    """
+    Consumo por ingrediente de las reservas vigentes ({ingrediente_id: cantidad}),
+    sumando la lista de materiales de cada producto reservado.
+    """
+    reservas = ReservaStock.objects.filter(expira_en__gt=timezone.now())
+    if excluir_usuario is not None and excluir_usuario.is_authenticated:
+        reservas = reservas.exclude(usuario=excluir_usuario)
+    return consumo_de(_unidades_por_producto(reservas))
+
+
+def consumo_retenido(usuario, otras_lineas):
+    """
+    Lo que una línea de la bolsa no puede usar: las reservas vigentes de los
+    demás clientes más lo que consumen las OTRAS líneas de la bolsa del
+    propio usuario (``otras_lineas``: sus CarritoItem sin la línea que se
+    edita). Dos productos distintos pueden compartir ingredientes.
+    """
+    return sumar_consumos(
+        consumo_reservas(excluir_usuario=usuario),
+        consumo_de(_unidades_por_producto(otras_lineas)),
+    )
+
+
+def bloquear_ingredientes(producto_ids):
+    """
+    SELECT ... FOR UPDATE de los ingredientes de estos productos, en orden de
+    id. Serializa a quienes reservan el mismo ingrediente (el checkout no
+    bloquea: descuenta con ``descontar_ingredientes``). Devuelve los ids
+    bloqueados.
+    """
+    ingrediente_ids = ingredientes_de(producto_ids)
+    if not ingrediente_ids:
+        return []
+    return list(
+        Ingrediente.objects.select_for_update()
+        .filter(id__in=ingrediente_ids)
+        .order_by('id')
+        .values_list('id', flat=True)
+    )
+
+
+def _publicar_cambio_reservas(producto_ids):
+    """Al confirmar, recalcula la disponibilidad de lo que comparte ingredientes."""
+    ingrediente_ids = ingredientes_de(producto_ids)
+    if ingrediente_ids:
+        al_confirmar_juntos(actualizar_stock_ingredientes, ingrediente_ids)
+
+
+def _vencimiento():
+    return timezone.now() + timedelta(minutes=RESERVA_MINUTOS)
+
+
+def reservar(usuario, producto_id, cantidad):
+    """Crea o actualiza (y extiende) la reserva del usuario para un producto."""
+    ReservaStock.objects.update_or_create(
+        usuario=usuario, producto_id=producto_id,
+        defaults={'cantidad': cantidad, 'expira_en': _vencimiento()},
+    )
+    _publicar_cambio_reservas([producto_id])
+
+
+def liberar_reservas(usuario, producto_ids=None):
+    """Elimina las reservas del usuario (todas o sólo de esos productos)."""
+    reservas = ReservaStock.objects.filter(usuario=usuario)
+    if producto_ids is not None:
+        reservas = reservas.filter(producto_id__in=producto_ids)
+
+    liberados = list(reservas.values_list('producto_id', flat=True))
+    if liberados:
+        reservas.delete()
+        _publicar_cambio_reservas(liberados)
+
+
+def ajustar_reserva(usuario, producto_id):
+    """
+    Deja la reserva del producto igual a lo que suman las líneas de la bolsa
+    que todavía lo tienen (puede haber más de una); sin líneas, la libera.
+    """
+    total = CarritoItem.objects.filter(usuario=usuario, producto_id=producto_id).aggregate(
+        total=Sum('cantidad'),
+    )['total']
+    if total:
+        reservar(usuario, producto_id, total)
+    else:
+        liberar_reservas(usuario, [producto_id])
+
+
+def renovar_reservas(usuario):
+    """
+    Extiende las reservas vigentes de la bolsa y vuelve a crear las que
+    vencieron (o faltan). Sólo si se recrea alguna cambia la disponibilidad.
+    """
+    ahora = timezone.now()
+    vencimiento = _vencimiento()
+
+    en_bolsa = dict(
+        CarritoItem.objects.filter(usuario=usuario).order_by()
+        .values('producto_id').annotate(total=Sum('cantidad'))
+        .values_list('producto_id', 'total')
+    )
+    vigentes = set(
+        ReservaStock.objects.filter(usuario=usuario, expira_en__gt=ahora)
+        .values_list('producto_id', flat=True)
+    )
+    if vigentes:
+        ReservaStock.objects.filter(usuario=usuario, producto_id__in=vigentes).update(expira_en=vencimiento)
+
+    nuevas = [
+        ReservaStock(usuario=usuario, producto_id=producto_id, cantidad=cantidad, expira_en=vencimiento)
+        for producto_id, cantidad in en_bolsa.items()
+        if producto_id not in vigentes
+    ]
+    if nuevas:
+        ReservaStock.objects.bulk_create(
+            nuevas,
+            update_conflicts=True,
+            unique_fields=['usuario', 'producto'],
+            update_fields=['cantidad', 'expira_en'],
+        )
+        _publicar_cambio_reservas([r.producto_id for r in nuevas])
+
+
+def expirar_reservas():
+    """
+    Borra en bloque las reservas vencidas y las versiones de bolsa que ya
+    nadie usa. Devuelve cuántas reservas se liberaron.
+    """
+    total = 0
+    vencidas = ReservaStock.objects.filter(expira_en__lte=timezone.now())
+    producto_ids = set(vencidas.values_list('producto_id', flat=True))
+    if producto_ids:
+        with transaction.atomic():
+            total, _ = vencidas.delete()
+            _publicar_cambio_reservas(producto_ids)
+    olvidar_versiones_carrito()
+    return total
+
+
+def olvidar_versiones_carrito():
+    """
+    Borra el contador de versión de la bolsa de los usuarios sin bolsa ni
+    reservas, para no guardar una fila por cada cliente que alguna vez
+    compró. Si vuelve, ``subir_version`` lo recrea desde la semilla por hora,
+    que no repite versiones viejas.
+    """
+    activos = set(CarritoItem.objects.values_list('usuario_id', flat=True).distinct())
+    activos |= set(ReservaStock.objects.values_list('usuario_id', flat=True).distinct())
+    borrados, _ = (
+        Contador.objects.filter(clave__startswith=CARRITO_VERSION_KEY.format(usuario_id=''))
+        .exclude(clave__in=[CARRITO_VERSION_KEY.format(usuario_id=u) for u in activos])
+        .delete()
+    )
+    return borrados
+
+
+# ==============================================
+#  CONFLICTOS DE CONCURRENCIA (deadlock / serialización)
+# ==============================================
+
+# SQLSTATE de PostgreSQL: 40P01 deadlock_detected, 40001 serialization_failure
+CODIGOS_CONFLICTO = {'40P01', '40001'}
+REINTENTOS_CONFLICTO = 4
+ESPERA_BASE_CONFLICTO = 0.05  # segundos; se duplica en cada intento
+
+
+def es_conflicto_concurrencia(error):
+    """True si la base abortó la transacción por deadlock o serialización."""
+    causa = error.__cause__
+    # psycopg2 expone ``pgcode``; psycopg 3 ``sqlstate``
+    codigo = getattr(causa, 'pgcode', None) or getattr(causa, 'sqlstate', None)
+    return codigo in CODIGOS_CONFLICTO
+
+
+def con_reintentos(funcion, intentos=REINTENTOS_CONFLICTO):
+    """
+    Ejecuta ``funcion`` (que abre su propia ``transaction.atomic()``) y la
+    repite si la base la aborta por un conflicto de concurrencia, con espera
+    exponencial y algo de azar para que los competidores no choquen de nuevo.
+    Cualquier otro error, o el último intento fallido, se propaga.
+
+    Sólo se puede repetir lo que NO se confirmó. Los ``on_commit`` corren al
+    salir del ``atomic``, ya con el COMMIT hecho: por eso todos se registran
+    con ``al_confirmar`` (``robust=True``: un error ahí queda en el log y no
+    sale de ``funcion``); si no, un deadlock en un hook repetiría un pedido
+    ya confirmado.
+    """
+    for intento in range(1, intentos + 1):
+        try:
+            return funcion()
+        except OperationalError as e:
+            if intento == intentos or not es_conflicto_concurrencia(e):
+                raise
+            time.sleep(ESPERA_BASE_CONFLICTO * 2 ** (intento - 1) * (1 + random.random()))
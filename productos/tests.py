@@ -1,3 +1,412 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from inventario.models import ComponenteCombo, Ingrediente, MovimientoInventario, Receta
+from pedidos.models import Pedido
+from usuarios.models import Rol, Usuario
+from . import eventos, idempotencia
+from .models import CambioInventario, Categoria, CarritoItem, ClaveIdempotencia, Contador, Producto, ReservaStock
+from .stock import CAMBIOS_CONSERVADOS, MAX_VERSIONES_DELTA, cambios_desde, expirar_reservas
+from .versiones import registrar_evento
+
+
+class _Deadlock(Exception):
+    pgcode = '40P01'
+
+
+def _error_deadlock():
+    error = OperationalError('deadlock detected')
+    error.__cause__ = _Deadlock()
+    return error
+
+
+class DatosMenu:
+    """Un cliente con sesión, pan/carne/queso y dos hamburguesas."""
+
+    def crear_datos(self):
+        # Las versiones se leen de la caché: nada de la prueba anterior
+        cache.clear()
+        rol = Rol.objects.get_or_create(nombre='Cliente')[0]
+        self.usuario = Usuario.objects.create_user('cliente@bullburger.test', 'x', nombre='Cliente', rol=rol)
+        self.client = Client()
+        self.client.force_login(self.usuario)
+
+        categoria = Categoria.objects.create(nombre='Hamburguesas')
+        self.pan = Ingrediente.objects.create(
+            nombre='Pan', unidad_medida='unidad', stock_actual=Decimal('10'), stock_minimo=Decimal('1'),
+        )
+        self.carne = Ingrediente.objects.create(
+            nombre='Carne', unidad_medida='g', stock_actual=Decimal('1000'), stock_minimo=Decimal('10'),
+        )
+        self.queso = Ingrediente.objects.create(
+            nombre='Queso', unidad_medida='unidad', stock_actual=Decimal('3'), stock_minimo=Decimal('1'),
+        )
+        self.hamburguesa = Producto.objects.create(nombre='Hamburguesa', precio=Decimal('5'), categoria=categoria)
+        self.con_queso = Producto.objects.create(nombre='Con queso', precio=Decimal('6'), categoria=categoria)
+        for producto, ingrediente, cantidad in (
+            (self.hamburguesa, self.pan, 1), (self.hamburguesa, self.carne, 150),
+            (self.con_queso, self.pan, 1), (self.con_queso, self.carne, 150), (self.con_queso, self.queso, 1),
+        ):
+            Receta.objects.create(producto=producto, ingrediente=ingrediente, cantidad=Decimal(cantidad))
+
+    def agregar(self, producto, cantidad=1):
+        return self.client.post(
+            reverse('agregar_al_carrito'),
+            json.dumps({'producto_id': producto.id, 'cantidad': cantidad}),
+            content_type='application/json',
+        )
+
+    def checkout(self, **cabeceras):
+        return self.client.post(
+            reverse('carrito_checkout'),
+            json.dumps({'metodo': 'efectivo', 'entrega': 'local'}),
+            content_type='application/json',
+            **cabeceras,
+        )
+
+    def stock(self, ingrediente):
+        ingrediente.refresh_from_db()
+        return ingrediente.stock_actual
+
+
+class CheckoutTests(DatosMenu, TransactionTestCase):
+    # Transacciones reales: los on_commit corren como en producción
+
+    def setUp(self):
+        self.crear_datos()
+
+    def test_descuenta_y_vacia_la_bolsa(self):
+        self.agregar(self.hamburguesa, 2)
+        respuesta = self.checkout()
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(Pedido.objects.count(), 1)
+        self.assertEqual(self.stock(self.pan), 8)
+        self.assertEqual(self.stock(self.carne), 700)
+        self.assertFalse(CarritoItem.objects.exists())
+        self.assertEqual(MovimientoInventario.objects.filter(ingrediente__isnull=False).count(), 2)
+
+    def test_sin_stock_no_crea_pedido(self):
+        self.agregar(self.con_queso, 2)
+        Ingrediente.objects.filter(id=self.queso.id).update(stock_actual=1)
+        respuesta = self.checkout()
+
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(Pedido.objects.count(), 0)
+        self.assertEqual(self.stock(self.pan), 10)
+        self.assertEqual(CarritoItem.objects.count(), 1)
+
+    def test_saldos_de_los_movimientos(self):
+        # Otro descuento entre la lectura del menú y el checkout: el saldo
+        # del movimiento sale del stock ya descontado, no de una lectura previa
+        self.agregar(self.hamburguesa, 2)
+        Ingrediente.objects.filter(id=self.pan.id).update(stock_actual=7)
+        self.checkout()
+
+        saldos = list(
+            MovimientoInventario.objects.filter(ingrediente=self.pan)
+            .values_list('cantidad_anterior', 'cantidad_nueva')
+        )
+        self.assertEqual(saldos, [(7, 5)])
+        self.assertEqual(self.stock(self.pan), 5)
+
+    def test_una_version_por_checkout(self):
+        self.agregar(self.hamburguesa)
+        self.agregar(self.con_queso)
+        cambios = CambioInventario.objects.count()
+        bolsa = Contador.objects.get(clave=f'carrito:version:{self.usuario.pk}').valor
+        self.checkout()
+
+        # Reservas liberadas y stock descontado: un solo evento, una subida de bolsa
+        self.assertEqual(CambioInventario.objects.count(), cambios + 1)
+        self.assertEqual(Contador.objects.get(clave=f'carrito:version:{self.usuario.pk}').valor, bolsa + 1)
+
+    def test_consultas_no_crecen_con_las_lineas(self):
+        # Mismos ingredientes (un UPDATE por ingrediente), distinta cantidad de líneas
+        doble = Producto.objects.create(nombre='Doble', precio=Decimal('7'), categoria=self.hamburguesa.categoria)
+        Receta.objects.create(producto=doble, ingrediente=self.pan, cantidad=Decimal('1'))
+        Receta.objects.create(producto=doble, ingrediente=self.carne, cantidad=Decimal('300'))
+        self.agregar(doble)
+        self.checkout()  # crea los contadores
+
+        self.agregar(self.hamburguesa)
+        with CaptureQueriesContext(connection) as una_linea:
+            self.checkout()
+        self.agregar(self.hamburguesa)
+        self.agregar(doble)
+        with CaptureQueriesContext(connection) as dos_lineas:
+            self.checkout()
+        self.assertEqual(len(dos_lineas), len(una_linea))
+
+    def test_hook_con_deadlock_no_repite_el_pedido(self):
+        # El pedido ya se confirmó: un error en un on_commit no debe
+        # disparar con_reintentos ni devolver 500
+        self.agregar(self.hamburguesa)
+        with mock.patch('pedidos.signals.publicar_cambio', side_effect=_error_deadlock()) as publicar:
+            respuesta = self.checkout()
+
+        self.assertTrue(publicar.called)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(Pedido.objects.count(), 1)
+        self.assertEqual(self.stock(self.pan), 9)
+        self.assertEqual(self.stock(self.carne), 850)
+
+
+class DisponibilidadTests(DatosMenu, TransactionTestCase):
+
+    def setUp(self):
+        self.crear_datos()
+
+    def unidades(self, producto):
+        return Producto.objects.values_list('unidades_disponibles', flat=True).get(id=producto.id)
+
+    def test_receta_actualiza_columnas_en_la_transaccion(self):
+        self.assertEqual(self.unidades(self.hamburguesa), 6)
+        with transaction.atomic():
+            Receta.objects.filter(producto=self.hamburguesa, ingrediente=self.carne).get().delete()
+            # Antes de confirmar: ya se ve dentro de la misma transacción
+            self.assertEqual(self.unidades(self.hamburguesa), 10)
+
+    def test_borrar_producto_recompila_sus_combos(self):
+        combo = Producto.objects.create(nombre='Combo', precio=Decimal('9'), categoria=self.hamburguesa.categoria)
+        ComponenteCombo.objects.create(combo=combo, producto=self.hamburguesa, cantidad=1)
+        ComponenteCombo.objects.create(combo=combo, producto=self.con_queso, cantidad=1)
+        # 2 panes y 300 g de carne por combo; el queso limita a 3
+        self.assertEqual(self.unidades(combo), 3)
+
+        self.con_queso.delete()
+        self.assertEqual(self.unidades(combo), 6)
+
+
+class StockApiTests(DatosMenu, TestCase):
+
+    def setUp(self):
+        self.crear_datos()
+
+    def test_etag_es_la_version_del_cuerpo(self):
+        respuesta = self.client.get(reverse('api_stock'))
+        self.assertEqual(respuesta['ETag'], f'"{respuesta.json()["version"]}"')
+
+        repetida = self.client.get(reverse('api_stock'), HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(repetida.status_code, 304)
+
+
+class MenuTests(DatosMenu, TransactionTestCase):
+
+    def setUp(self):
+        self.crear_datos()
+
+    def test_agregar_a_la_bolsa_no_invalida_las_tarjetas(self):
+        self.client.get(reverse('menu_cliente'))
+        with CaptureQueriesContext(connection) as tibio:
+            self.client.get(reverse('menu_cliente'))
+
+        self.agregar(self.hamburguesa)
+        with CaptureQueriesContext(connection) as despues:
+            respuesta = self.client.get(reverse('menu_cliente'))
+
+        self.assertEqual(len(despues), len(tibio))
+        self.assertEqual(respuesta.context['stock_usuario'][self.hamburguesa.id], 5)
+
+    def test_producto_agotado_sale_del_menu(self):
+        self.client.get(reverse('menu_cliente'))
+        Ingrediente.objects.filter(id=self.queso.id).update(stock_actual=0)
+        self.queso.refresh_from_db()
+        self.queso.save()
+
+        respuesta = self.client.get(reverse('menu_cliente'))
+        self.assertNotContains(respuesta, f'data-id="{self.con_queso.id}"')
+        self.assertContains(respuesta, f'data-id="{self.hamburguesa.id}"')
+
+
+class ReservasTests(DatosMenu, TestCase):
+
+    def setUp(self):
+        self.crear_datos()
+
+    def reservado(self, producto):
+        return ReservaStock.objects.filter(usuario=self.usuario, producto=producto).values_list('cantidad', flat=True).first()
+
+    def test_agregar_reserva_y_retiene_para_otros(self):
+        self.agregar(self.con_queso, 2)
+        self.assertEqual(self.reservado(self.con_queso), 2)
+
+        # Queda 1 queso para los demás clientes
+        otro = Usuario.objects.create_user('otro@bullburger.test', 'x', nombre='Otro', rol=self.usuario.rol)
+        self.client.force_login(otro)
+        self.assertEqual(self.agregar(self.con_queso, 2).status_code, 400)
+        self.assertTrue(self.agregar(self.con_queso, 1).json()['ok'])
+
+    def test_eliminar_una_linea_conserva_la_otra(self):
+        primera = CarritoItem.objects.create(usuario=self.usuario, producto=self.hamburguesa, cantidad=2)
+        CarritoItem.objects.create(usuario=self.usuario, producto=self.hamburguesa, cantidad=3)
+        ReservaStock.objects.create(
+            usuario=self.usuario, producto=self.hamburguesa, cantidad=5,
+            expira_en=timezone.now() + timedelta(minutes=15),
+        )
+
+        self.client.post(reverse('eliminar_item_carrito', args=[primera.id]))
+        self.assertEqual(self.reservado(self.hamburguesa), 3)
+
+    def test_expirar_libera_reservas_y_versiones_de_bolsa(self):
+        self.agregar(self.hamburguesa)
+        clave = f'carrito:version:{self.usuario.pk}'
+        Contador.objects.get_or_create(clave=clave, defaults={'valor': 1})
+        CarritoItem.objects.all().delete()
+        ReservaStock.objects.update(expira_en=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(expirar_reservas(), 1)
+        self.assertFalse(ReservaStock.objects.exists())
+        self.assertFalse(Contador.objects.filter(clave=clave).exists())
+
+
+class IdempotenciaTests(DatosMenu, TestCase):
+
+    def setUp(self):
+        self.crear_datos()
+
+    def test_repite_la_respuesta_sin_crear_otro_pedido(self):
+        self.agregar(self.hamburguesa)
+        primera = self.checkout(HTTP_IDEMPOTENCY_KEY='k1')
+        repetida = self.checkout(HTTP_IDEMPOTENCY_KEY='k1')
+
+        self.assertEqual(primera.status_code, 200)
+        self.assertEqual(repetida.status_code, 200)
+        self.assertEqual(repetida['Idempotent-Replayed'], 'true')
+        self.assertEqual(repetida.json(), primera.json())
+        self.assertEqual(Pedido.objects.count(), 1)
+
+    def test_misma_clave_con_otros_datos(self):
+        self.agregar(self.hamburguesa)
+        self.checkout(HTTP_IDEMPOTENCY_KEY='k1')
+        respuesta = self.client.post(
+            reverse('carrito_checkout'),
+            json.dumps({'metodo': 'tarjeta', 'entrega': 'local'}),
+            content_type='application/json',
+            HTTP_IDEMPOTENCY_KEY='k1',
+        )
+        self.assertEqual(respuesta.status_code, 422)
+
+    def test_clave_liberada_durante_el_reclamo(self):
+        # El INSERT choca con la fila de la original, que se borra (5xx)
+        # antes de poder leerla: se vuelve a reclamar en lugar de DoesNotExist
+        crear = ClaveIdempotencia.objects.create
+        intentos = []
+
+        def chocar_una_vez(**campos):
+            intentos.append(campos)
+            if len(intentos) == 1:
+                raise IntegrityError('duplicada')
+            return crear(**campos)
+
+        with mock.patch.object(ClaveIdempotencia.objects, 'create', side_effect=chocar_una_vez):
+            registro, es_nuevo = idempotencia._reclamar(self.usuario, 'k1', 'h')
+
+        self.assertTrue(es_nuevo)
+        self.assertEqual(len(intentos), 2)
+        self.assertEqual(registro.clave, 'k1')
+
+    def test_purgar_solo_vencidas(self):
+        ahora = timezone.now()
+        for clave, expira_en in (('vieja', ahora - timedelta(hours=1)), ('vigente', ahora + timedelta(hours=1))):
+            ClaveIdempotencia.objects.create(usuario=self.usuario, clave=clave, huella='h', expira_en=expira_en)
+
+        call_command('purgar_idempotencia', stdout=StringIO())
+        self.assertEqual(list(ClaveIdempotencia.objects.values_list('clave', flat=True)), ['vigente'])
+
+
+class CambiosDesdeTests(TestCase):
+    # Versiones explícitas: dentro de TestCase nada se confirma ni se publica
+
+    def registrar(self, productos=(), completo=False):
+        return registrar_evento(
+            CambioInventario, CAMBIOS_CONSERVADOS, productos=list(productos), completo=completo,
+        ).id
+
+    def test_une_los_productos_de_cada_evento(self):
+        desde = self.registrar([1])
+        self.registrar([2])
+        hasta = self.registrar([2, 3])
+        self.assertEqual(cambios_desde(desde, hasta), {2, 3})
+        self.assertEqual(cambios_desde(hasta, hasta), set())
+
+    def test_invalidacion_completa_pide_el_mapa(self):
+        desde = self.registrar([1])
+        self.registrar(completo=True)
+        hasta = self.registrar([2])
+        self.assertIsNone(cambios_desde(desde, hasta))
+
+    def test_evento_faltante_pide_el_mapa(self):
+        desde = self.registrar([1])
+        podado = self.registrar([2])
+        hasta = self.registrar([3])
+        CambioInventario.objects.filter(id=podado).delete()
+        self.assertIsNone(cambios_desde(desde, hasta))
+
+    def test_version_vieja_o_futura(self):
+        hasta = self.registrar([1])
+        self.assertIsNone(cambios_desde(hasta - MAX_VERSIONES_DELTA - 1, hasta))
+        self.assertIsNone(cambios_desde(hasta + 1, hasta))
+
+
+class _DifusorDePrueba(eventos.Difusor):
+    def __init__(self):
+        super().__init__()
+        self.version = 1
+        self.lecturas = 0
+
+    def leer_version(self):
+        self.lecturas += 1
+        return self.version
+
+    def armar_evento(self, desde, actual):
+        return f'{desde}>{actual}'
+
+
+@mock.patch.object(eventos, 'INTERVALO_VIGILANCIA', 0.01)
+class DifusorTests(SimpleTestCase):
+
+    def test_un_vigilante_para_todas_las_conexiones(self):
+        difusor = _DifusorDePrueba()
+
+        async def conexion(listo):
+            cola = difusor.suscribir()
+            listo.set()
+            try:
+                return await asyncio.wait_for(cola.get(), timeout=2)
+            finally:
+                difusor.desuscribir(cola)
+
+        async def conexiones():
+            listos = [asyncio.Event() for _ in range(3)]
+            tareas = [asyncio.ensure_future(conexion(listo)) for listo in listos]
+            for listo in listos:
+                await listo.wait()
+            await asyncio.sleep(0.05)
+            # Un solo hilo para las tres conexiones
+            self.assertEqual(
+                [hilo.name for hilo in threading.enumerate()].count('_DifusorDePrueba'), 1,
+            )
+            difusor.version = 2
+            return await asyncio.gather(*tareas)
+
+        self.assertEqual(asyncio.run(conexiones()), ['1>2'] * 3)
+        # Sin suscriptores el hilo termina
+        for _ in range(100):
+            if difusor._hilo is None:
+                break
+            threading.Event().wait(0.01)
+        self.assertIsNone(difusor._hilo)
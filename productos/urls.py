@@ -25,5 +25,6 @@ urlpatterns = [
     # ==========================================================
     
     path('api/stock/', views.api_stock_productos, name='api_stock'),
+    path('api/stock/stream/', views.api_stock_stream, name='api_stock_stream'),
     path("api/stock/<int:producto_id>/", views.api_stock_producto, name="api_stock_producto"),
 ]
\ No newline at end of file
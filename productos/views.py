@@ -6,15 +6,28 @@ import re
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.http import require_POST
-from django.db import transaction
-from django.http import JsonResponse
+from django.core.cache import cache
+from django.views.decorators.http import require_POST, require_GET
+from django.db import IntegrityError, transaction
+from django.http import JsonResponse, StreamingHttpResponse
 from django.urls import reverse, NoReverseMatch
-from django.db.models import Prefetch
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 
 # Modelos propios
 from .models import Producto, Categoria, CarritoItem
 from .forms import ProductoForm
+from .stock import (
+    stock_por_producto, stock_por_producto_cache, stock_para_usuario,
+    cambios_desde, token_stock,
+    consumo_reservas, consumo_retenido, bloquear_ingredientes, reservar, liberar_reservas, ajustar_reserva,
+    renovar_reservas, version_catalogo, version_inventario, version_recetas,
+    stock_ingredientes_cambiado, con_reintentos, descontar_ingredientes,
+    STOCK_DIFERIDO, registrar_consumo,
+    consumo_de, lista_materiales,
+)
+from .eventos import stream_stock
+from .idempotencia import idempotente
 
 # Inventario / Recetas / Movimientos
 from inventario.models import Ingrediente, Receta, MovimientoInventario
@@ -24,9 +37,8 @@ from pedidos.models import Pedido, DetallePedido
 # Usuario
 from usuarios.models import Usuario
 
-# Generador de facturas
-from inventario.utils_factura import generar_factura_pdf
-from django.conf import settings
+# Cola de facturas
+from pedidos.facturas import BAJO_DEMANDA as FACTURAS_BAJO_DEMANDA, encolar_factura
 
 # Chequeo opcional de Inventario
 _INV_PRODUCTO_OK = False
@@ -278,60 +290,55 @@ def eliminar_categoria(request, categoria_id):
 # 🔹 CLIENTE — MENÚ Y CARRITO
 # ==============================================
 
-def menu_cliente(request):
-    categorias = Categoria.objects.all().order_by('nombre')
-
-    # Consulta inicial
-    productos_qs = Producto.objects.filter(disponible=True).select_related('categoria').prefetch_related(
-        Prefetch('receta_set', queryset=Receta.objects.select_related('ingrediente'))
-    ).order_by('nombre')
-
-    productos_raw = [
-        producto for producto in productos_qs if producto.is_currently_available
-    ]
-
-    # --- START: LÓGICA DE DEDUCCIÓN DEL CARRITO ---
-    items_carrito = CarritoItem.objects.filter(usuario=request.user).select_related("producto")
-
-    consumo_global = {}
-    for item in items_carrito:
-        recetas = Receta.objects.filter(producto=item.producto).select_related("ingrediente")
-        for r in recetas:
-            total_req = r.cantidad * item.cantidad
-            consumo_global[r.ingrediente_id] = consumo_global.get(r.ingrediente_id, 0) + total_req
-
-    productos_final = []
-
-    for producto in productos_raw:
-        recetas = Receta.objects.filter(producto=producto).select_related("ingrediente")
-
-        if not recetas.exists():
-            producto.stock_disponible = 9999
-            productos_final.append(producto)
-            continue
-
-        stock_posibles = []
+# Categorías del menú, bajo la versión del catálogo (que sube al tocarlas)
+MENU_CATEGORIAS_KEY = 'menu:categorias:v{version}'
+MENU_CATEGORIAS_TIMEOUT = 60 * 60
 
-        for r in recetas:
-            ing = r.ingrediente
-            stock_disp = ing.stock_actual - consumo_global.get(ing.id, 0)
-            if stock_disp < 0:
-                stock_disp = 0
 
-            if r.cantidad > 0:
-                stock_posibles.append(stock_disp // r.cantidad)
-
-        stock_real = min(stock_posibles) if stock_posibles else 0
-        producto.stock_disponible = stock_real
-
-        if stock_real > 0:
-            productos_final.append(producto)
-
-    # --- END: LÓGICA DE DEDUCCIÓN DEL CARRITO ---
+def menu_cliente(request):
+    # Se lee antes que el stock: el stream retoma desde aquí (?desde=) y no
+    # se pierde lo que cambie mientras se arma la página
+    version = version_inventario()
+    catalogo = version_catalogo()
+    categorias = cache.get(MENU_CATEGORIAS_KEY.format(version=catalogo))
+    if categorias is None:
+        categorias = list(Categoria.objects.all().order_by('nombre'))
+        cache.set(MENU_CATEGORIAS_KEY.format(version=catalogo), categorias, MENU_CATEGORIAS_TIMEOUT)
+
+    # Filtro simple sobre columnas materializadas e indexadas
+    productos_qs = Producto.objects.filter(
+        disponible=True, disponible_por_stock=True
+    ).select_related('categoria').order_by('nombre')
+
+    # Qué productos se muestran de cada categoría: lo único de las tarjetas
+    # que depende del stock, y sólo cambia cuando un producto se agota o
+    # vuelve. Va en la llave del fragmento (ver plantilla) en lugar de la
+    # versión del inventario, que sube con cada producto agregado a una bolsa
+    visibles = {}
+    for producto_id, categoria_id in productos_qs.order_by('id').values_list('id', 'categoria_id'):
+        visibles.setdefault(categoria_id, []).append(producto_id)
+
+    # Las tarjetas se cachean por categoría; estas consultas son perezosas y
+    # sólo se ejecutan si el fragmento no está en caché
+    for categoria in categorias:
+        categoria.productos_menu = productos_qs.filter(categoria=categoria)
+        categoria.productos_visibles = visibles.get(categoria.id, [])
+    productos_sin_categoria = productos_qs.filter(categoria__isnull=True)
+
+    # Stock que todavía se puede agregar: el mapa compartido de esta versión
+    # (construible menos TODAS las reservas, la bolsa propia incluida), el
+    # mismo al que el stream le aplica los deltas
+    stock_usuario = stock_por_producto_cache(version)
 
     return render(request, 'cliente/menu_cliente.html', {
         'categorias': categorias,
-        'productos': productos_final
+        'productos_sin_categoria': productos_sin_categoria,
+        'visibles_sin_categoria': visibles.get(None, []),
+        # Lo único propio de cada usuario: se aplica sobre las tarjetas cacheadas
+        'stock_usuario': stock_usuario,
+        'version_catalogo': catalogo,
+        'version_recetas': version_recetas(),
+        'version_inventario': version,
     })
 
 
@@ -356,50 +363,39 @@ def agregar_al_carrito(request):
     except Producto.DoesNotExist:
         return JsonResponse({'ok': False, 'error': 'Producto no encontrado'}, status=404)
 
-    recetas = Receta.objects.filter(producto=producto).select_related("ingrediente")
+    with transaction.atomic():
+        # Quien compite por los mismos ingredientes espera aquí su turno
+        bloquear_ingredientes([producto.id])
 
-    if not recetas.exists():
-        stock_disponible = 9999
-    else:
-        stock_list = []
-        for r in recetas:
-            ing = r.ingrediente
-            if r.cantidad <= 0:
-                continue
-            stock_list.append(ing.stock_actual // r.cantidad)
-
-        stock_disponible = min(stock_list) if stock_list else 0
+        # Stock menos lo que reservaron OTROS clientes y lo que consume el
+        # resto de su propia bolsa
+        retenido = consumo_retenido(
+            request.user, CarritoItem.objects.filter(usuario=request.user).exclude(producto=producto)
+        )
+        stock_producto = stock_por_producto([producto.id], consumo=retenido).get(producto.id, 0)
 
-    item, creado = CarritoItem.objects.get_or_create(usuario=request.user, producto=producto)
-    nueva_cantidad = item.cantidad + cantidad_solicitada if not creado else cantidad_solicitada
+        item = CarritoItem.objects.filter(usuario=request.user, producto=producto).first()
+        nueva_cantidad = item.cantidad + cantidad_solicitada if item else cantidad_solicitada
 
-    if stock_disponible <= 0:
-        return JsonResponse({'ok': False, 'error': 'Producto agotado'})
-
-    if nueva_cantidad > stock_disponible:
-        return JsonResponse({
-            'ok': False,
-            'error': f"Solo hay {stock_disponible} unidades disponibles"
-        }, status=400)
+        if stock_producto <= 0:
+            return JsonResponse({'ok': False, 'error': 'Producto agotado'})
 
-    item.cantidad = nueva_cantidad
-    item.save()
-
-    # Actualizar stock de todos los productos
-    stock_map = {}
-    for p in Producto.objects.filter(disponible=True):
-        recetas_p = Receta.objects.filter(producto=p).select_related("ingrediente")
+        if nueva_cantidad > stock_producto:
+            return JsonResponse({
+                'ok': False,
+                'error': f"Solo hay {stock_producto} unidades disponibles"
+            }, status=400)
 
-        if not recetas_p.exists():
-            stock_map[p.id] = 9999
-            continue
+        if item:
+            item.cantidad = nueva_cantidad
+            item.save()
+        else:
+            CarritoItem.objects.create(usuario=request.user, producto=producto, cantidad=nueva_cantidad)
 
-        stock_list_p = []
-        for r in recetas_p:
-            if r.cantidad > 0:
-                stock_list_p.append(r.ingrediente.stock_actual // r.cantidad)
+        reservar(request.user, producto.id, nueva_cantidad)
 
-        stock_map[p.id] = min(stock_list_p) if stock_list_p else 0
+    # Actualizar stock de todos los productos (desde caché si no hubo cambios)
+    stock_map = stock_por_producto_cache()
 
     return JsonResponse({
         'ok': True,
@@ -410,6 +406,9 @@ def agregar_al_carrito(request):
 
 @login_required
 def ver_carrito(request):
+    # Mientras el cliente mira su bolsa, su stock sigue reservado
+    renovar_reservas(request.user)
+
     items = CarritoItem.objects.filter(usuario=request.user).select_related('producto')
     total = sum(item.subtotal() for item in items)
     return render(request, 'cliente/carrito_cliente.html', {
@@ -428,35 +427,28 @@ def editar_cantidad(request, item_id):
         if nueva_cantidad < 1:
             return JsonResponse({"ok": False, "error": "Cantidad no válida"}, status=400)
 
-        item = CarritoItem.objects.select_related('producto').get(id=item_id, usuario=request.user)
-        producto = item.producto
-
-        recetas = Receta.objects.filter(producto=producto).select_related("ingrediente")
-
-        if not recetas.exists():
-            stock_receta = 9999
-        else:
-            stock_list = []
-            for r in recetas:
-                if r.cantidad > 0:
-                    stock_list.append(r.ingrediente.stock_actual // r.cantidad)
-            stock_receta = min(stock_list) if stock_list else 0
-
-        otros = CarritoItem.objects.filter(usuario=request.user, producto=producto).exclude(id=item.id).first()
-        reservados_otros = otros.cantidad if otros else 0
+        with transaction.atomic():
+            item = CarritoItem.objects.select_related('producto').get(id=item_id, usuario=request.user)
+            producto = item.producto
+
+            bloquear_ingredientes([producto.id])
+            # Las demás líneas de su bolsa (incluida otra del mismo producto)
+            # ya cuentan en lo retenido
+            retenido = consumo_retenido(
+                request.user, CarritoItem.objects.filter(usuario=request.user).exclude(id=item.id)
+            )
+            stock_disponible = stock_por_producto([producto.id], consumo=retenido).get(producto.id, 0)
 
-        stock_disponible = stock_receta - reservados_otros
-        if stock_disponible < 0:
-            stock_disponible = 0
+            if nueva_cantidad > stock_disponible:
+                return JsonResponse({
+                    "ok": False,
+                    "error": f"Solo hay {stock_disponible} unidades disponibles"
+                }, status=400)
 
-        if nueva_cantidad > stock_disponible:
-            return JsonResponse({
-                "ok": False,
-                "error": f"Solo hay {stock_disponible} unidades disponibles"
-            }, status=400)
+            item.cantidad = nueva_cantidad
+            item.save()
 
-        item.cantidad = nueva_cantidad
-        item.save()
+            ajustar_reserva(request.user, producto.id)
 
         return JsonResponse({"ok": True, "mensaje": "Cantidad actualizada correctamente"})
 
@@ -472,7 +464,10 @@ def editar_cantidad(request, item_id):
 def eliminar_item_carrito(request, item_id):
     try:
         item = CarritoItem.objects.get(id=item_id, usuario=request.user)
-        item.delete()
+        with transaction.atomic():
+            item.delete()
+            # Otra línea del mismo producto sigue reservando lo suyo
+            ajustar_reserva(request.user, item.producto_id)
         return JsonResponse({"ok": True, "mensaje": "Producto eliminado del carrito"})
     except CarritoItem.DoesNotExist:
         return JsonResponse({"ok": False, "error": "El producto no existe en el carrito"}, status=404)
@@ -485,8 +480,9 @@ def eliminar_item_carrito(request, item_id):
 # ==============================================
 @login_required
 @require_POST
+@idempotente
 def carrito_checkout(request):
-    """Crea Pedido + Detalles + Factura PDF"""
+    """Crea Pedido + Detalles y encola la Factura PDF"""
     try:
         payload = json.loads(request.body.decode('utf-8'))
     except Exception:
@@ -524,14 +520,16 @@ def carrito_checkout(request):
         request.user.telefono = telefono
         request.user.save(update_fields=['telefono'])
 
-    items = CarritoItem.objects.select_related('producto').filter(usuario=request.user)
-    if not items.exists():
+    # 1) La bolsa se lee UNA sola vez
+    items = list(CarritoItem.objects.select_related('producto').filter(usuario=request.user))
+    if not items:
         return JsonResponse({'ok': False, 'error': 'Tu bolsa está vacía'}, status=400)
 
     subtotal = sum((it.producto.precio * it.cantidad for it in items), Decimal('0.00'))
     total = subtotal
 
-    try:
+    # Se repite entera si PostgreSQL la aborta por deadlock o serialización
+    def registrar_pedido():
         with transaction.atomic():
             pedido = Pedido.objects.create(
                 usuario=request.user,
@@ -544,134 +542,178 @@ def carrito_checkout(request):
                 total=total
             )
 
-            for it in items:
-                DetallePedido.objects.create(
+            # En orden de producto: las FK se validan (KEY SHARE) en ese orden
+            DetallePedido.objects.bulk_create([
+                DetallePedido(
                     pedido=pedido,
                     producto=it.producto,
                     cantidad=it.cantidad,
                     subtotal=it.producto.precio * it.cantidad
                 )
+                for it in sorted(items, key=lambda it: it.producto_id)
+            ])
 
-            if _INV_PRODUCTO_OK:
-                for it in items.select_for_update():
-                    try:
-                        inv = Inventario.objects.select_for_update().get(producto=it.producto)
-                        anterior = int(inv.stock)
-                        nuevo = max(0, anterior - int(it.cantidad))
-                        inv.stock = nuevo
-                        inv.save(update_fields=['stock'])
-                        MovimientoInventario.objects.create(
-                            producto=it.producto,
-                            ingrediente=None,
-                            tipo='salida',
-                            cantidad=Decimal(it.cantidad),
-                            cantidad_anterior=Decimal(anterior),
-                            cantidad_nueva=Decimal(nuevo),
-                            motivo=f'Venta - Pedido {pedido.id}',
-                            usuario=request.user
-                        )
-                    except Inventario.DoesNotExist:
-                        pass
+            movimientos = []
 
-            for it in items:
-                recetas = Receta.objects.select_related('ingrediente').filter(producto=it.producto)
-                for rec in recetas.select_for_update():
-                    ing = rec.ingrediente
-                    requerido = Decimal(rec.cantidad) * Decimal(it.cantidad)
-                    anterior = Decimal(ing.stock_actual)
-                    if anterior < requerido:
-                        raise ValueError(f'Sin stock suficiente del ingrediente "{ing.nombre}"')
-                    ing.stock_actual = anterior - requerido
-                    ing.save(update_fields=['stock_actual'])
-                    MovimientoInventario.objects.create(
-                        ingrediente=ing,
+            # 2) Inventario de producto terminado (si existe): un SELECT + un UPDATE
+            if _INV_PRODUCTO_OK:
+                por_producto = {it.producto_id: it for it in items}
+                inventarios = list(
+                    Inventario.objects.select_for_update()
+                    .filter(producto_id__in=por_producto).order_by('producto_id')
+                )
+                for inv in inventarios:
+                    it = por_producto[inv.producto_id]
+                    anterior = int(inv.stock)
+                    inv.stock = max(0, anterior - int(it.cantidad))
+                    movimientos.append(MovimientoInventario(
+                        producto=it.producto,
+                        ingrediente=None,
                         tipo='salida',
-                        cantidad=requerido,
-                        cantidad_anterior=anterior,
-                        cantidad_nueva=ing.stock_actual,
-                        motivo=f'Consumo por venta de "{it.producto.nombre}" (Pedido {pedido.id})',
+                        cantidad=Decimal(it.cantidad),
+                        cantidad_anterior=Decimal(anterior),
+                        cantidad_nueva=Decimal(inv.stock),
+                        motivo=f'Venta - Pedido {pedido.id}',
                         usuario=request.user
-                    )
-
-            items.delete()
+                    ))
+                Inventario.objects.bulk_update(inventarios, ['stock'])
 
-            factura_url = generar_factura_pdf(pedido)
+            # 3) Ingredientes: la lista de materiales compilada (combos ya
+            #    resueltos, en caché) convierte la bolsa en UNA suma de vectores
+            cantidades = {}
+            for it in items:
+                cantidades[it.producto_id] = cantidades.get(it.producto_id, 0) + it.cantidad
+            requerido = consumo_de(cantidades)
+            materiales = lista_materiales()
+            lineas = sorted(
+                (ing_id, producto_id, cantidad * cantidades[producto_id])
+                for producto_id in cantidades
+                for ing_id, cantidad in materiales.get(producto_id, {}).items()
+            )
 
-            factura_path_relativo = None
-            if factura_url and factura_url.startswith(settings.MEDIA_URL):
-                factura_path_relativo = factura_url[len(settings.MEDIA_URL):]
-                if factura_path_relativo:
-                    pedido.factura_pdf = factura_path_relativo
-                    pedido.save(update_fields=['factura_pdf'])
+            CarritoItem.objects.filter(id__in=[it.id for it in items]).delete()
+            # El stock se descuenta abajo: las reservas de la bolsa sobran
+            liberar_reservas(request.user)
+
+            # El PDF nunca se dibuja aquí: bajo demanda se genera en la primera
+            # descarga; si no, lo hace el worker (manage.py generar_facturas)
+            if not FACTURAS_BAJO_DEMANDA:
+                encolar_factura(pedido)
+
+            # Lo reservado por OTROS clientes no se puede vender aquí. Sin
+            # SELECT ... FOR UPDATE: cada ingrediente se valida y descuenta en
+            # un único UPDATE condicional (ver descontar_ingredientes), o en
+            # modo diferido sólo se inserta en el libro de consumos
+            retenido = consumo_reservas(excluir_usuario=request.user)
+            if STOCK_DIFERIDO:
+                saldo = registrar_consumo(requerido, retenido)
+            else:
+                saldo = descontar_ingredientes(requerido, retenido)
+
+            # Un movimiento por línea de receta y producto, con el saldo corrido
+            # reconstruido desde el saldo final de cada ingrediente (leído con
+            # la fila ya bloqueada: exacto aunque haya checkouts en paralelo)
+            for ing_id, cantidad in requerido.items():
+                saldo[ing_id] += cantidad
+            productos = {it.producto_id: it.producto for it in items}
+            for ing_id, producto_id, consumo in lineas:
+                anterior = saldo[ing_id]
+                saldo[ing_id] = anterior - consumo
+                movimientos.append(MovimientoInventario(
+                    ingrediente_id=ing_id,
+                    tipo='salida',
+                    cantidad=consumo,
+                    cantidad_anterior=anterior,
+                    cantidad_nueva=saldo[ing_id],
+                    motivo=f'Consumo por venta de "{productos[producto_id].nombre}" (Pedido {pedido.id})',
+                    usuario=request.user
+                ))
+
+            MovimientoInventario.objects.bulk_create(movimientos)
+
+            # QuerySet.update no dispara señales: las columnas materializadas
+            # de los productos que usan estos ingredientes se refrescan aquí,
+            # en la misma transacción (productos/signals.py hace lo mismo)
+            if not STOCK_DIFERIDO:
+                stock_ingredientes_cambiado(requerido)
+
+            return pedido
 
-            return JsonResponse({
-                'ok': True,
-                'pedido_id': pedido.id,
-                'total': f'{total:.2f}',
-                'factura_url': factura_url
-            })
+    try:
+        pedido = con_reintentos(registrar_pedido)
+        return JsonResponse({
+            'ok': True,
+            'pedido_id': pedido.id,
+            'total': f'{total:.2f}',
+            'factura_pendiente': not FACTURAS_BAJO_DEMANDA,
+            'pedidos_url': reverse('pedidos_cliente'),
+        })
 
     except ValueError as ve:
         return JsonResponse({'ok': False, 'error': str(ve)}, status=400)
+    except IntegrityError:
+        # La restricción stock_actual >= 0 frenó un descuento que se coló
+        return JsonResponse({'ok': False, 'error': 'Sin stock suficiente para completar el pedido'}, status=400)
     except Exception as e:
         return JsonResponse({'ok': False, 'error': f'Error interno: {e}'}, status=500)
 
 
+@require_GET
 def api_stock_productos(request):
-    productos = Producto.objects.filter(disponible=True)
-    data = {}
-
-    for p in productos:
-        recetas = Receta.objects.filter(producto=p).select_related("ingrediente")
-
-        if not recetas.exists():
-            stock_receta = 9999
-        else:
-            stock_list = []
-            for r in recetas:
-                if r.cantidad > 0:
-                    stock_list.append(r.ingrediente.stock_actual // r.cantidad)
-            stock_receta = min(stock_list) if stock_list else 0
-
-        reservados_qs = CarritoItem.objects.filter(usuario=request.user, producto=p)
-        reservados = reservados_qs.first().cantidad if reservados_qs else 0
-
-        stock_final = stock_receta - reservados
-        if stock_final < 0:
-            stock_final = 0
-
-        data[p.id] = stock_final
+    """
+    Stock de todos los productos para el usuario (anónimo = sin reservas).
 
-    return JsonResponse({"stock": data})
+    - Responde 304 si el ETag (versión de inventario + bolsa) no cambió.
+    - ``?since=<version>`` devuelve sólo los productos que cambiaron desde esa
+      versión; si no se puede calcular el delta, manda el mapa completo.
+    """
+    # Un solo token: el del ETag es el mismo que se informa en el cuerpo
+    token = token_stock(request.user)
+    etag = quote_etag(token)
+    no_cambio = get_conditional_response(request, etag=etag)
+    if no_cambio is not None:
+        return no_cambio
+
+    inv_actual, _, carrito_actual = token.partition('.')
+    # Mapa y delta de la MISMA versión que se informa al cliente
+    data = stock_por_producto_cache(int(inv_actual))
+    completo = True
+
+    since = request.GET.get('since', '')
+    inv_since, _, carrito_since = since.partition('.')
+    if inv_since.isdigit() and carrito_since == carrito_actual:
+        cambios = cambios_desde(int(inv_since), int(inv_actual))
+        if cambios is not None:
+            data = {pid: unidades for pid, unidades in data.items() if pid in cambios}
+            completo = False
+
+    response = JsonResponse({"stock": data, "version": token, "completo": completo})
+    response['ETag'] = etag
+    return response
+
+
+@require_GET
+async def api_stock_stream(request):
+    """
+    Server-Sent Events con los cambios de disponibilidad (deltas compactos).
+    Necesita servirse con ASGI (bullburger/asgi.py). Al reconectar el
+    navegador manda Last-Event-ID; la primera vez, ``?desde=`` trae la versión
+    con la que se dibujó el menú y se reenvía lo que cambió desde entonces.
+    """
+    ultima = request.headers.get('Last-Event-ID') or request.GET.get('desde', '')
+    response = StreamingHttpResponse(
+        stream_stock(int(ultima) if ultima.isdigit() else None),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: no acumular el stream
+    return response
 
 
 @login_required
 def api_stock_producto(request, producto_id):
-    try:
-        producto = Producto.objects.get(id=producto_id)
-        recetas = Receta.objects.filter(producto=producto).select_related("ingrediente")
-
-        if not recetas.exists():
-            stock_disponible = 9999
-        else:
-            stock_list = []
-            for r in recetas:
-                if r.cantidad > 0:
-                    stock_list.append(r.ingrediente.stock_actual // r.cantidad)
-
-            stock_disponible = min(stock_list) if stock_list else 0
-
-        actual = CarritoItem.objects.filter(usuario=request.user, producto=producto).first()
-        if actual:
-            stock_disponible -= actual.cantidad
-
-        if stock_disponible < 0:
-            stock_disponible = 0
-
-        return JsonResponse({"stock": stock_disponible})
-
-    except Producto.DoesNotExist:
-        return JsonResponse({"stock": 0})
+    stock = stock_para_usuario([producto_id], usuario=request.user)
+    return JsonResponse({"stock": stock.get(producto_id, 0)})
 
 
 # -----------------------------------------------------------------
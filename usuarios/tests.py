@@ -1,3 +1,45 @@
+from datetime import timedelta
+
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from pedidos.models import Pedido
+from .models import Rol, Usuario
+from .views import PEDIDOS_POR_PAGINA
+
+
+class HistorialPedidosTests(TestCase):
+
+    def setUp(self):
+        rol = Rol.objects.get_or_create(nombre='Empleado')[0]
+        empleado = Usuario.objects.create_user('cocina@bullburger.test', 'x', nombre='Cocina', rol=rol)
+        self.client.force_login(empleado)
+
+        # Dos páginas y media; de a tres con la misma fecha para probar el desempate por id
+        ahora = timezone.now()
+        total = PEDIDOS_POR_PAGINA * 2 + 5
+        Pedido.objects.bulk_create([Pedido(usuario=empleado, estado='entregado') for _ in range(total)])
+        for i, pedido in enumerate(Pedido.objects.order_by('id')):
+            Pedido.objects.filter(id=pedido.id).update(fecha=ahora - timedelta(minutes=i // 3))
+
+    def test_recorre_todo_sin_repetir_ni_saltar(self):
+        vistos, antes, paginas = [], None, 0
+        while True:
+            parametros = {'vista': 'historial'}
+            if antes:
+                parametros['antes'] = antes
+            respuesta = self.client.get(reverse('gestion_pedidos'), parametros)
+            vistos += [p.id for p in respuesta.context['pedidos']]
+            paginas += 1
+            antes = respuesta.context['siguiente']
+            if not antes:
+                break
+
+        esperado = list(Pedido.objects.order_by('-fecha', '-id').values_list('id', flat=True))
+        self.assertEqual(vistos, esperado)
+        self.assertEqual(paginas, 3)
 
-# Create your tests here.
+    def test_cursor_invalido_empieza_de_cero(self):
+        respuesta = self.client.get(reverse('gestion_pedidos'), {'vista': 'historial', 'antes': 'x'})
+        self.assertEqual(len(respuesta.context['pedidos']), PEDIDOS_POR_PAGINA)
@@ -9,6 +9,7 @@ urlpatterns = [
 
     # Dashboards
     path('administrador/dashboard/', views.admin_dashboard, name='admin_dashboard'),
+    path('administrador/facturas/exportar/', views.exportar_facturas, name='exportar_facturas'),
     path('empleado/dashboard/', views.empleado_dashboard, name='empleado_dashboard'),
     path('cliente/dashboard/', views.cliente_dashboard, name='cliente_dashboard'),
 
@@ -39,11 +40,13 @@ urlpatterns = [
     
     #mis pedidos
     path('cliente/pedidos/', views.pedidos_cliente_view, name='pedidos_cliente'),
+    path('cliente/pedidos/<int:pedido_id>/factura/', views.descargar_factura, name='descargar_factura'),
     path('cliente/menu/', views.cliente_dashboard, name='menu_cliente'), 
     
     #vista de empleado para gestionar pedidos
     path('empleado/dashboard/', views.dashboard_empleado, name='dashboard_empleado'),
     path('empleado/api/estadisticas/', views.api_estadisticas, name='api_estadisticas'),
+    path('empleado/api/pedidos/stream/', views.api_pedidos_stream, name='api_pedidos_stream'),
     path('empleado/pedidos/', views.gestion_pedidos, name='gestion_pedidos'),
     path('empleado/pedidos/actualizar-estado/<int:pedido_id>/', views.actualizar_estado_pedido, name='actualizar_estado_pedido'),
     
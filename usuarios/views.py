@@ -1,12 +1,14 @@
 import json
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponseNotAllowed
-from django.views.decorators.http import require_http_methods, require_POST
+from django.http import JsonResponse, HttpResponseNotAllowed, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from django.views.decorators.http import require_http_methods, require_GET, require_POST, require_safe
 from django.db import transaction
-from django.db.models import Q, Sum, F, Value, DecimalField, Case, When # 👈 IMPORTACIONES DE BD
+from django.db.models import Q, Sum, F, Value, DecimalField, Case, When, Prefetch # 👈 IMPORTACIONES DE BD
 from django.db.models.functions import Coalesce # 👈 IMPORTACIÓN IMPORTANTE
 from .forms import CambiarPasswordForm, UsuarioAdminForm 
 
@@ -17,15 +19,19 @@ from .forms import PerfilForm
 from django.contrib.auth import update_session_auth_hash
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
-from django.core.files.storage import default_storage
-from django.http import FileResponse
 import os
 from django.utils import timezone
-from datetime import datetime, date
+from collections import Counter
+from datetime import datetime, date, timedelta, timezone as dt_timezone
 
 # --- 🚀 IMPORTAR MODELOS DE OTRAS APPS ---
 from productos.models import Categoria, Producto
-from pedidos.models import Pedido
+from pedidos.cocina import version_cocina
+from pedidos.eventos import stream_cocina
+from pedidos.models import DetallePedido, Pedido
+from pedidos.descargas import contenido_streaming, servir_archivo
+from pedidos.exportacion import pedidos_facturables, zip_facturas
+from pedidos.facturas import asegurar_factura
 from inventario.models import Ingrediente
 # ------------------------------------------
 
@@ -155,13 +161,38 @@ def admin_dashboard(request):
 # ==============================================
 
 
+@login_required
+@require_safe
+def exportar_facturas(request):
+    """ZIP con las facturas de un rango de fechas, armado mientras se descarga."""
+    if not request.user.es_administrador():
+        messages.error(request, "No tienes permiso para exportar facturas.")
+        return redireccionar_por_rol(request.user)
+
+    try:
+        desde = date.fromisoformat(request.GET.get('desde', ''))
+        hasta = date.fromisoformat(request.GET.get('hasta', ''))
+    except ValueError:
+        desde = hasta = None
+    if not desde or not hasta or desde > hasta:
+        messages.error(request, "Indica un rango de fechas válido.")
+        return redirect('admin_dashboard')
+
+    respuesta = StreamingHttpResponse(
+        contenido_streaming(request, zip_facturas(pedidos_facturables(desde, hasta))),
+        content_type='application/zip',
+    )
+    respuesta['Content-Disposition'] = content_disposition_header(True, f'facturas_{desde}_{hasta}.zip')
+    return respuesta
+
+
 @login_required
 def empleado_dashboard(request):
     if not request.user.es_empleado():
         messages.error(request, "No tienes permiso para acceder al panel de empleado.")
         return redireccionar_por_rol(request.user)
 
-    return render(request, 'empleado/dashboard.html')
+    return dashboard_empleado(request)
 
 @login_required
 def cliente_dashboard(request):
@@ -466,6 +497,8 @@ def perfil_cambiar_password(request):
 def pedidos_cliente_view(request):
     pedidos_list = Pedido.objects.filter(
         usuario=request.user
+    ).select_related(
+        'trabajo_factura'
     ).prefetch_related(
         'detallepedido_set__producto'
     ).order_by('-fecha')
@@ -476,32 +509,79 @@ def pedidos_cliente_view(request):
     return render(request, 'cliente/pedidos_cliente.html', context)
 
 @login_required
+@require_safe
 def descargar_factura(request, pedido_id):
+    """
+    La factura se dibuja en la primera descarga (ver pedidos/facturas.py);
+    las siguientes responden 304 o por rangos.
+    """
     pedido = get_object_or_404(Pedido, id=pedido_id, usuario=request.user)
-    f = pedido.factura_pdf
-    if not (f and f.name and default_storage.exists(f.name)):
-        messages.warning(request, "La factura no está disponible.")
+    try:
+        nombre = asegurar_factura(pedido)
+    except Exception:
+        messages.warning(request, "No se pudo generar la factura. Intenta de nuevo en unos minutos.")
         return redirect("pedidos_cliente")
-    return FileResponse(f.open("rb"), as_attachment=True, filename=os.path.basename(f.name))
+    return servir_archivo(request, nombre, descargar_como=os.path.basename(nombre))
 
 
 
 #metods para empleados
+PEDIDOS_POR_PAGINA = 30
+_EPOCA = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _cursor_pedido(pedido):
+    """'<microsegundos>-<id>' del pedido: el historial sigue desde él."""
+    return f'{(pedido.fecha - _EPOCA) // timedelta(microseconds=1)}-{pedido.id}'
+
+
+def _leer_cursor(valor):
+    try:
+        micro, pedido_id = (int(x) for x in valor.split('-'))
+    except (AttributeError, ValueError):
+        return None
+    return _EPOCA + timedelta(microseconds=micro), pedido_id
+
+
 @login_required
 def gestion_pedidos(request):
-    pedidos = Pedido.objects.all().order_by('-fecha')
-    
-    pedidos_pendientes = pedidos.filter(estado='pendiente')
-    pedidos_preparando = pedidos.filter(estado='preparando')
-    pedidos_listos = pedidos.filter(estado='listo')
-    pedidos_entregados = pedidos.filter(estado='entregado')
-    
+    """
+    Tablero de cocina. Por defecto sólo los pedidos activos: el costo
+    depende de lo que hay en cocina, no de cuántos días lleva abierto el
+    local. ``?vista=historial`` recorre todos por fecha, paginando por
+    cursor (``?antes=``) en lugar de OFFSET. Lo que cambie después llega
+    por ``api_pedidos_stream`` desde ``version_cocina``.
+    """
+    # Se lee antes que los pedidos: nada de lo que pase en medio se pierde
+    version = version_cocina()
+    pedidos = Pedido.objects.select_related('usuario').prefetch_related(
+        Prefetch('detallepedido_set', queryset=DetallePedido.objects.select_related('producto'))
+    ).order_by('-fecha', '-id')
+
+    historial = request.GET.get('vista') == 'historial'
+    siguiente = None
+    if historial:
+        cursor = _leer_cursor(request.GET.get('antes'))
+        if cursor:
+            fecha, pedido_id = cursor
+            pedidos = pedidos.filter(Q(fecha__lt=fecha) | Q(fecha=fecha, id__lt=pedido_id))
+        pedidos = list(pedidos[:PEDIDOS_POR_PAGINA + 1])
+        if len(pedidos) > PEDIDOS_POR_PAGINA:
+            pedidos = pedidos[:PEDIDOS_POR_PAGINA]
+            siguiente = _cursor_pedido(pedidos[-1])
+    else:
+        pedidos = list(pedidos.filter(estado__in=Pedido.ESTADOS_ACTIVOS))
+
+    por_estado = Counter(p.estado for p in pedidos)
     context = {
         'pedidos': pedidos,
-        'pedidos_pendientes': pedidos_pendientes,
-        'pedidos_preparando': pedidos_preparando,
-        'pedidos_listos': pedidos_listos,
-        'pedidos_entregados': pedidos_entregados,
+        'historial': historial,
+        'siguiente': siguiente,
+        'total_pedidos': len(pedidos),
+        'total_pendientes': por_estado['pendiente'],
+        'total_preparando': por_estado['preparando'],
+        'total_listos': por_estado['listo'],
+        'version_cocina': version,
     }
     return render(request, 'empleado/gestion_pedidos.html', context)
 
@@ -529,6 +609,7 @@ def dashboard_empleado(request):
     """Vista del dashboard para empleados con estadísticas"""
     try:
         hoy = date.today()
+        version = version_cocina()
         
         pedidos_hoy = Pedido.objects.filter(fecha__date=hoy)
         
@@ -544,6 +625,8 @@ def dashboard_empleado(request):
             'pedidos_preparando': pedidos_hoy.filter(estado='preparando'),
             'pedidos_listos': pedidos_hoy.filter(estado='listo'),
             'now': timezone.now(),
+            'hoy': hoy.isoformat(),
+            'version_cocina': version,
         }
         return render(request, 'empleado/dashboard.html', context)
         
@@ -582,4 +665,29 @@ def api_estadisticas(request):
             'pedidos_pendientes': 0,
             'pedidos_preparando': 0,
             'pedidos_listos': 0,
-        })
\ No newline at end of file
+        })
+
+
+@login_required
+@require_GET
+async def api_pedidos_stream(request):
+    """
+    Server-Sent Events del tablero de cocina: pedidos nuevos y cambios de
+    estado como deltas compactos (ver pedidos/cocina.py). Reemplaza el
+    sondeo de ``api_estadisticas`` y las recargas de ``gestion_pedidos``.
+    Necesita servirse con ASGI (bullburger/asgi.py).
+    """
+    usuario = await request.auser()
+    if not await sync_to_async(lambda: usuario.es_empleado() or usuario.es_administrador())():
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+
+    # Al reconectar el navegador manda Last-Event-ID; la primera vez llega
+    # la versión con la que se dibujó la página
+    ultima = request.headers.get('Last-Event-ID') or request.GET.get('desde', '')
+    response = StreamingHttpResponse(
+        stream_cocina(int(ultima) if ultima.isdigit() else None),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: no acumular el stream
+    return response